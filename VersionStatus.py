@@ -1,8 +1,31 @@
+import bz2
+import codecs
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import gzip
+import hashlib
+import http.client
+import http.server
+import io
+import json
+import lzma
 import operator
 import os
+import random
 import re
+import sqlite3
 import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import urllib.parse
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
 from collections import defaultdict, OrderedDict
 from typing import Any
 
@@ -10,89 +33,662 @@ import click
 import jinja2
 import requests
 import validators
+import yaml
 from packaging import version
 
+import rpmvercmp
+
 OS_URI = "https://releases.openstack.org/{}"
-RPM_OS_URI_MAPPING = {
-    # Archived version
-    ('20.09', '21.03'):
-        "https://archives.openeuler.openatom.cn/openEuler-{oe_version}/EPOL/"
-        "{aarch}/Packages/",
-    ('21.09', '22.09'):
-        "https://archives.openeuler.openatom.cn/openEuler-{oe_version}/EPOL/"
-        "main/{aarch}/Packages/",
-    # Active version
-    ('20.03-LTS', '20.03-LTS-SP1'):
-        "https://repo.openeuler.org/openEuler-{oe_version}/EPOL/{aarch}/"
-        "Packages/",
-    ('20.03-LTS-SP2',):
-        "https://repo.oepkgs.net/openEuler/rpm/openEuler-{oe_version}/"
-        "budding-openeuler/openstack/{os_version}/{aarch}/Packages/",
-    ('20.03-LTS-SP3', '20.03-LTS-SP4'):
-        defaultdict(
-            lambda: "https://repo.openeuler.org/openEuler-{oe_version}/EPOL/"
-                    "main/{aarch}/Packages/",
-            dict(rocky="https://repo.oepkgs.net/openEuler/rpm/"
-                       "openEuler-{oe_version}/budding-openeuler/openstack/"
-                       "{os_version}/{aarch}/Packages/",
-                 queens="https://repo.oepkgs.net/openEuler/rpm/"
-                        "openEuler-{oe_version}/budding-openeuler/openstack/"
-                        "{os_version}/{aarch}/Packages/")
-        ),
-    # OpenStack SIG decide to end supporting for openEuler innovation release
-    # from openEuler 23.03 because of lacking users that use OpenStack with
-    # openEuler innovation release, most users use openEuler LTS release to
-    # deploy OpenStack. openEuler LTS supporting will continue forever :)
-    ('22.03-LTS',
-     '22.03-LTS-SP1', '22.03-LTS-SP2', '22.03-LTS-SP3', '22.03-LTS-SP4',
-     '24.03-LTS', '24.03-LTS-SP1', '25.03'):
-        "https://repo.openeuler.org/openEuler-{oe_version}/EPOL/multi_version"
-        "/OpenStack/{os_version}/{aarch}/Packages/",
-    # Deprecated dev version start
-    ('dev-20.03-LTS', 'dev-20.03-LTS-SP1', 'dev-20.03-LTS-SP2',
-     'dev-20.03-LTS-SP3', 'dev-20.03-LTS-Next',
-     'dev-20.09', 'dev-21.03', 'dev-21.09', 'dev-22.09',
-     'dev-Mainline'):
-        "http://119.3.219.20:82/openEuler:/{oe_version_v}/{oe_version_lts}/"
-        "{oe_version_sp}/Epol/standard_{aarch}/{aarch_option}/",
-    ('dev-22.03-LTS', 'dev-22.03-LTS-SP1', 'dev-22.03-LTS-SP2',
-     'dev-22.03-LTS-SP3', 'dev-22.03-LTS-SP4', 'dev-22.03-LTS-Next'):
-        "http://119.3.219.20:82/openEuler:/{oe_version_v}/{oe_version_lts}/"
-        "{oe_version_sp}/Epol:/Multi-Version:/OpenStack:/{os_version}/"
-        "standard_{aarch}/{aarch_option}",
-    # Deprecated dev version end
-    ('dev-24.03-LTS', 'dev-24.03-LTS-Next', ):
-        "https://eulermaker.compass-ci.openeuler.openatom.cn/api/ems2/"
-        "repositories/openEuler_{oe_version_v}_{oe_version_lts}_Epol_"
-        "Multi-Version_OpenStack_{os_version}/openEuler%3A{oe_version_v}-"
-        "{oe_version_lts}/{aarch}/Packages/",
-    ('dev-24.03-LTS-SP1', 'dev-24.03-LTS-SP2',
-     'dev-24.03-LTS-SP3', 'dev-24.03-LTS-SP4'):
-        "https://eulermaker.compass-ci.openeuler.openatom.cn/api/ems2/"
-        "repositories/openEuler_{oe_version_v}_{oe_version_lts}_"
-        "{oe_version_sp}_Epol_Multi-Version_OpenStack_{os_version}/"
-        "openEuler%3A{oe_version_v}-{oe_version_lts}-{oe_version_sp}/{aarch}/"
-        "Packages/",
-}
+# URI templates of openEuler repos, see config/repositories.yaml
+DEFAULT_REPO_CONFIG = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                                   'config', 'repositories.yaml')
 OPENEULER_REPO_DOMAIN = "repo.openeuler.org"
 DEFAULT_FILE_TYPE = 'html'
+FILE_TYPES = ('html', 'txt', 'json', 'ndjson', 'pages')
+# formats whose output file extension differs from the format name
+FILE_EXTENSIONS = {'pages': 'html'}
+# templates of formats which are not rendered by the default template
+FORMAT_TEMPLATES = {'pages': 'template_os_checker_pages.j2'}
+# directory next to the index where the pages format writes release data
+PAGES_DATA_DIR = 'data'
+STDOUT_FILE_NAME = '-'
+# output files are written to temporary files created 0600, which get the
+# mode open() would give under the umask, reading the umask means setting
+# it, so it is read once at import before any thread is started
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+# version of comparison results, it is part of the digest of a release in
+# the state file, bump it when comparison logic or compared data changes so
+# results of older runs are not reused
+RESULT_SCHEMA_VERSION = 2
+CHANGELOG_FILE_TYPES = ('json', 'txt')
 STATUS_NONE = ["0", "NONE"]
 STATUS_OK = ["1", "OK"]
 STATUS_EOL = ["2", "EOL"]
 STATUS_OUTDATED = ["3", "OUTDATED"]
 STATUS_MISMATCH = ["4", "MISMATCH"]
 STATUS_MISSING = ["5", "MISSING"]
+STATUSES = [STATUS_NONE, STATUS_OK, STATUS_EOL, STATUS_OUTDATED,
+            STATUS_MISMATCH, STATUS_MISSING]
+# status by sign of comparison of upstream and openEuler versions
+SIGN_STATUS = {0: STATUS_OK, 1: STATUS_OUTDATED, -1: STATUS_MISMATCH}
 UPSTREAM_FILTER_LIST = [
-    re.compile(r"^puppet[-_][-_\w]+$"),  # puppet-*
-    re.compile(r"^[-_\w]+[-_]dashboard$"),  # *-dashboard
-    re.compile(r"^[-_\w]+[-_]ui$"),  # *-ui
-    re.compile(r"^[-_\w]+[-_]tempest[-_]plugin$"),  # *-tempest-plugin
+    r"^puppet[-_][-_\w]+$",  # puppet-*
+    r"^[-_\w]+[-_]dashboard$",  # *-dashboard
+    r"^[-_\w]+[-_]ui$",  # *-ui
+    r"^[-_\w]+[-_]tempest[-_]plugin$",  # *-tempest-plugin
 ]
 OPENEULER_DEFAULT_REPLACE = re.compile(r"[._]")
-REQUESTS_ARGS = {}
+# Rules to transform OpenStack package name to openEuler package name, in
+# order of preference. Each rule (old, new) is applied to upstream name with
+# OPENEULER_DEFAULT_REPLACE done, "old" is replaced with "new", or "new" is
+# added as prefix if "old" is empty.
+PAIRING_RULES = [
+    ('', ''),
+    ('python-', 'python2-'),
+    ('python-', 'python3-'),
+    ('', 'python2-'),
+    ('', 'python3-'),
+    ('', 'openstack-'),
+]
+# get all links, which ends .rpm from HTML, work for oepkg and openEuler EPOL
+# page format
+RPM_LINK_PATTERN = re.compile(r'<a\shref="(.*?\.rpm)"[\s>]')
 AARCH64 = 'aarch64'
+X86_64 = 'x86_64'
 NOARCH = 'noarch'
+ARCHES = (AARCH64, X86_64, NOARCH)
 EOL_PKG_SUFFIX = ('last', 'eom')
+# pre-release of upstream version, e.g. 13.0.0.0rc1 or 2.0.0b2
+UPSTREAM_PRE_RELEASE = re.compile(r"^([0-9.]+?)\.?((?:a|b|rc|dev)[0-9]*)$")
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST_LIMIT = 4
+# releases.openstack.org, repo.openeuler.org, EulerMaker and a few mirrors
+DEFAULT_POOL_HOSTS = 10
+DEFAULT_MAX_CACHE_AGE = 0
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+# redirects are replayed only if their target is recorded too
+RECORDED_HEADERS = CACHED_HEADERS + ('Location',)
+CHUNK_SIZE = 64 * 1024
+VERSION_CACHE_SIZE = 16384
+METRICS_PREFIX = 'os_version_checker'
+DEFAULT_TEMPLATE = 'template_os_checker.j2'
+TEMPLATE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                            'templates')
+DEFAULT_LISTEN = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_REFRESH_INTERVAL = 3600
+DEFAULT_REFRESH_JITTER = 300
+# results of every run, run_time is UTC time in ISO 8601 with microseconds,
+# so it sorts as text and runs in the same second do not replace each other
+HISTORY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS releases (
+    release TEXT NOT NULL,
+    run_time TEXT NOT NULL,
+    overall_status TEXT NOT NULL,
+    paired INTEGER NOT NULL,
+    PRIMARY KEY (release, run_time)
+);
+CREATE TABLE IF NOT EXISTS packages (
+    release TEXT NOT NULL,
+    package TEXT NOT NULL,
+    run_time TEXT NOT NULL,
+    base_version TEXT,
+    comparison_version TEXT,
+    status TEXT NOT NULL,
+    PRIMARY KEY (release, package, run_time)
+);
+CREATE INDEX IF NOT EXISTS packages_package
+    ON packages (package, release, run_time);
+'''
+STAGES = ('fetch', 'parse', 'compare', 'render')
+RPM_BACKENDS = ('html', 'repodata')
+DEFAULT_RPM_BACKEND = 'html'
+REPOMD_NS = {'repo': 'http://linux.duke.edu/metadata/repo'}
+PRIMARY_PACKAGE_TAG = '{http://linux.duke.edu/metadata/common}package'
+PRIMARY_NS = {'common': 'http://linux.duke.edu/metadata/common'}
+PRIMARY_DECOMPRESSORS = {
+    '.gz': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    '.bz2': bz2.BZ2Decompressor,
+    '.xz': lzma.LZMADecompressor,
+}
+
+
+def digest(data):
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def compile_filter(patterns):
+    # all patterns are matched by one regex, so filtering a package is a
+    # single match however many patterns are given
+    if not patterns:
+        return re.compile(r"(?!)")
+    return re.compile("|".join("(?:{})".format(pattern)
+                               for pattern in patterns))
+
+
+UPSTREAM_FILTER = compile_filter(UPSTREAM_FILTER_LIST)
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def parse_version(_version):
+    # the same version strings show up in every release and on both sides
+    # of a comparison, parse each of them only once
+    return version.parse(_version)
+
+
+class Metrics:
+    # time, bytes and package counts of each stage, latency, status and
+    # size of each fetched URI, stage values add up over all refreshes of
+    # the daemon, so they are exported as counters
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            # (start, seconds) of the last finished refresh of the daemon
+            self.last_run = None
+            self.stages = {stage: dict(seconds=0.0, bytes=0, packages=0)
+                           for stage in STAGES}
+            self.uris = {}
+
+    def add_stage(self, stage, seconds, _bytes=0, packages=0):
+        with self._lock:
+            self.stages[stage]['seconds'] += seconds
+            self.stages[stage]['bytes'] += _bytes
+            self.stages[stage]['packages'] += packages
+
+    def add_uri(self, uri, status_code, latency, seconds, _bytes):
+        with self._lock:
+            self.uris[uri] = dict(status_code=status_code, latency=latency,
+                                  seconds=seconds, bytes=_bytes)
+        self.add_stage('fetch', seconds, _bytes)
+        # network time of the fetches made by this thread, so the parse time
+        # of a task is its run time without network time
+        self._local.network = self.network() + seconds
+
+    def run_finished(self, started):
+        with self._lock:
+            self.last_run = (started, time.time() - started)
+
+    def network(self):
+        return getattr(self._local, 'network', 0.0)
+
+    @contextlib.contextmanager
+    def parse(self):
+        start, network = time.perf_counter(), self.network()
+        yield
+        self.add_stage('parse', time.perf_counter() - start -
+                       (self.network() - network))
+
+    def report(self):
+        with self._lock:
+            started, seconds = self.last_run or (
+                self.started, time.time() - self.started)
+            return dict(started=started, seconds=seconds,
+                        stages={stage: dict(value) for stage, value
+                                in self.stages.items()},
+                        uris={uri: dict(value) for uri, value
+                              in self.uris.items()})
+
+    def openmetrics(self):
+        # OpenMetrics text, also readable by textfile collector of
+        # node_exporter
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n')
+
+        report = self.report()
+        lines = []
+        families = [
+            ('run_seconds', 'gauge', 'Duration of the last run or refresh', [
+                ('', report['seconds'])]),
+            ('run_timestamp_seconds', 'gauge',
+             'Start time of the last run or refresh', [
+                 ('', report['started'])]),
+        ]
+        for key, unit, help_text in (
+                ('seconds', '_seconds', 'Time spent in stage'),
+                ('bytes', '_bytes', 'Bytes handled in stage'),
+                ('packages', '_packages', 'Packages handled in stage')):
+            families.append(('stage' + unit, 'counter', help_text, [
+                ('stage="{}"'.format(stage), value[key])
+                for stage, value in report['stages'].items()]))
+        for key, unit, help_text in (
+                ('latency', '_latency_seconds', 'Time to response headers'),
+                ('seconds', '_seconds', 'Time to fetch the whole body'),
+                ('bytes', '_bytes', 'Size of the body'),
+                ('status_code', '_status_code', 'HTTP status code')):
+            families.append(('uri' + unit, 'gauge', help_text, [
+                ('uri="{}"'.format(escape(uri)), value[key])
+                for uri, value in report['uris'].items()]))
+        for name, metric_type, help_text, samples in families:
+            name = '{}_{}'.format(METRICS_PREFIX, name)
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.append('# HELP {} {}'.format(name, help_text))
+            # samples of a counter are named with _total
+            sample = name + '_total' if metric_type == 'counter' else name
+            for labels, value in samples:
+                lines.append('{}{} {}'.format(
+                    sample, '{{{}}}'.format(labels) if labels else '', value))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write(path, content):
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory,
+                                         delete=False) as f:
+            f.write(content)
+        os.chmod(f.name, FILE_MODE)
+        os.replace(f.name, path)
+
+    def write_report(self, path):
+        self._write(path, json.dumps(self.report(), indent=2))
+
+    def write_openmetrics(self, path):
+        self._write(path, self.openmetrics())
+
+
+METRICS = Metrics()
+
+
+class HostLimiter:
+    def __init__(self, per_host=DEFAULT_PER_HOST_LIMIT):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def limit(self, uri):
+        # one semaphore per host, so a slow mirror can not starve the others
+        host = urllib.parse.urlsplit(uri).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            semaphore = self._semaphores[host]
+        with semaphore:
+            yield
+
+
+def build_response(request, status_code, headers, raw, adapter):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = http.client.responses.get(status_code)
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(
+        response.headers)
+    response.raw = raw
+    response.url = request.url
+    response.request = request
+    response.connection = adapter
+    return response
+
+
+class CacheWriter:
+    # file-like wrapper of response.raw, which copies the body into the
+    # cache while it is read and commits the entry when the body is complete
+    def __init__(self, raw, adapter, uri, meta):
+        self._raw = raw
+        self._adapter = adapter
+        self._uri = uri
+        self._meta = meta
+        self._tmp = tempfile.NamedTemporaryFile(dir=adapter.cache_dir,
+                                                delete=False)
+
+    def read(self, amt=None):
+        try:
+            chunk = self._raw.read(amt, decode_content=True)
+        except Exception:
+            self.close()
+            raise
+        if self._tmp is not None:
+            if chunk:
+                self._tmp.write(chunk)
+            else:
+                self._tmp.close()
+                self._adapter.store(self._uri, self._tmp.name, self._meta)
+                self._tmp = None
+        return chunk
+
+    def close(self):
+        # body is not fully read, discard partial cache entry
+        if self._tmp is not None:
+            self._tmp.close()
+            os.remove(self._tmp.name)
+            self._tmp = None
+        self._raw.close()
+
+    def release_conn(self):
+        self._raw.release_conn()
+
+
+class CachedBody:
+    # file-like response.raw of a cache entry, the body is streamed from its
+    # file, which is closed once the body is read to the end or the response
+    # is closed
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+
+    def read(self, amt=None):
+        if self._file.closed:
+            return b''
+        chunk = self._file.read(amt)
+        if amt is None or amt < 0 or len(chunk) < amt:
+            self.close()
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+class CachingAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, cache_dir, max_age=DEFAULT_MAX_CACHE_AGE, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, uri):
+        return os.path.join(self.cache_dir,
+                            hashlib.sha256(uri.encode()).hexdigest())
+
+    def load(self, uri):
+        try:
+            with open(self._path(uri) + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, uri, body_file, meta):
+        path = self._path(uri)
+        meta['fetched_at'] = time.time()
+        if body_file is not None:
+            os.replace(body_file, path + '.body')
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir,
+                                         delete=False) as f:
+            json.dump(meta, f)
+        os.replace(f.name, path + '.json')
+
+    def _cached_response(self, request, meta):
+        return build_response(
+            request, requests.codes.ok, meta['headers'],
+            CachedBody(self._path(request.url) + '.body'), self)
+
+    def _reply(self, request, meta, conditional):
+        # 304 if the caller already has the cached body, as told by its own
+        # conditional headers
+        if conditional and conditional == conditional_headers(
+                meta['headers']):
+            return build_response(request, requests.codes.not_modified,
+                                  meta['headers'], io.BytesIO(), self)
+        return self._cached_response(request, meta)
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        conditional = {k: request.headers[k]
+                       for k in ('If-None-Match', 'If-Modified-Since')
+                       if k in request.headers}
+        meta = self.load(request.url)
+        if meta is not None and \
+                not os.path.exists(self._path(request.url) + '.body'):
+            meta = None
+        if meta is not None:
+            if time.time() - meta['fetched_at'] < self.max_age:
+                return self._reply(request, meta, conditional)
+            # revalidate with the stored validators
+            if 'ETag' in meta['headers']:
+                request.headers['If-None-Match'] = meta['headers']['ETag']
+            if 'Last-Modified' in meta['headers']:
+                request.headers['If-Modified-Since'] = \
+                    meta['headers']['Last-Modified']
+        response = super().send(request, **kwargs)
+        if meta is not None and \
+                response.status_code == requests.codes.not_modified:
+            response.close()
+            self.store(request.url, None, meta)
+            return self._reply(request, meta, conditional)
+        if response.status_code == requests.codes.ok:
+            meta = dict(uri=request.url,
+                        headers={k: response.headers[k]
+                                 for k in CACHED_HEADERS
+                                 if k in response.headers})
+            response.raw = CacheWriter(response.raw, self, request.url, meta)
+        return response
+
+
+class ReplayArchive:
+    # zip archive of recorded responses, index.json maps each URI to its
+    # status code, headers and the archive member holding its body
+    def __init__(self, path):
+        self.path = path
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with zipfile.ZipFile(self.path) as archive:
+            index = json.loads(archive.read('index.json'))
+            for uri, entry in index.items():
+                self.responses[uri] = (entry['status_code'],
+                                       entry['headers'],
+                                       archive.read(entry['body']))
+        return self
+
+    def add(self, uri, status_code, headers, body):
+        with self._lock:
+            self.responses[uri] = (status_code, headers, body)
+
+    def save(self):
+        index = {}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as archive:
+                with self._lock:
+                    responses = dict(self.responses)
+                for uri, (status_code, headers, body) in responses.items():
+                    member = hashlib.sha256(uri.encode()).hexdigest()
+                    archive.writestr(member, body)
+                    index[uri] = dict(status_code=status_code,
+                                      headers=headers, body=member)
+                archive.writestr('index.json', json.dumps(index, indent=1))
+        os.chmod(f.name, FILE_MODE)
+        os.replace(f.name, self.path)
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    # record responses of the wrapped adapter into a ReplayArchive
+    def __init__(self, adapter, archive):
+        super().__init__()
+        self.adapter = adapter
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        # answers to conditional requests have no page to replay
+        if response.status_code == requests.codes.not_modified:
+            return response
+        self.archive.add(request.url, response.status_code,
+                         {k: response.headers[k] for k in RECORDED_HEADERS
+                          if k in response.headers},
+                         response.content)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    # serve recorded responses, nothing goes to the network
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        if request.url not in self.archive.responses:
+            raise requests.exceptions.ConnectionError(
+                '{} is not recorded in {}'.format(request.url,
+                                                  self.archive.path),
+                request=request)
+        status_code, headers, body = self.archive.responses[request.url]
+        return build_response(request, status_code, headers,
+                              io.BytesIO(body), self)
+
+    def close(self):
+        pass
+
+
+HOST_LIMITER = HostLimiter()
+SESSION = requests.Session()
+# compiled templates are kept for the process and their bytecode on disk,
+# so a new process skips parsing and compiling them again
+JINJA_ENV = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+    bytecode_cache=jinja2.FileSystemBytecodeCache())
+
+
+def setup_session(proxy=None, verify=True,
+                  per_host=DEFAULT_PER_HOST_LIMIT, cache_dir=None,
+                  max_cache_age=DEFAULT_MAX_CACHE_AGE):
+    # all fetches share one session, so connections to the same host are
+    # kept alive and reused instead of a new TCP+TLS handshake per URI
+    if cache_dir:
+        adapter = CachingAdapter(
+            cache_dir, max_cache_age,
+            pool_connections=DEFAULT_POOL_HOSTS, pool_maxsize=per_host)
+    else:
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=DEFAULT_POOL_HOSTS, pool_maxsize=per_host)
+    SESSION.mount('http://', adapter)
+    SESSION.mount('https://', adapter)
+    if isinstance(proxy, str) and validators.url(proxy):
+        SESSION.proxies.update({'http': proxy, 'https': proxy})
+    SESSION.verify = verify
+    HOST_LIMITER.per_host = per_host
+
+
+def setup_templates(cache_dir=None):
+    if cache_dir:
+        directory = os.path.join(cache_dir, 'templates')
+        os.makedirs(directory, exist_ok=True)
+        JINJA_ENV.bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+
+
+def setup_upstream_filter(patterns=(), files=()):
+    # filters are added to UPSTREAM_FILTER_LIST, files have one pattern per
+    # line, empty lines and lines starting with "#" are skipped
+    global UPSTREAM_FILTER
+    patterns = list(patterns)
+    for path in files:
+        with open(path) as f:
+            patterns.extend(line.strip() for line in f
+                            if line.strip() and
+                            not line.lstrip().startswith('#'))
+    for pattern in patterns:
+        re.compile(pattern)
+    UPSTREAM_FILTER = compile_filter(UPSTREAM_FILTER_LIST + patterns)
+
+
+def setup_recording(path):
+    # add to an existing archive, so fixtures can be collected over runs
+    archive = ReplayArchive(path)
+    if os.path.exists(path):
+        archive.load()
+    for prefix in ('http://', 'https://'):
+        SESSION.mount(prefix,
+                      RecordingAdapter(SESSION.get_adapter(prefix), archive))
+    return archive
+
+
+def setup_replay(path):
+    adapter = ReplayAdapter(ReplayArchive(path).load())
+    SESSION.mount('http://', adapter)
+    SESSION.mount('https://', adapter)
+
+
+class FetchError(RuntimeError):
+    pass
+
+
+class NotModified(Exception):
+    pass
+
+
+def conditional_headers(validators):
+    # validators is a dict with ETag and Last-Modified of the last response
+    # of a URI, it is updated in place from every new response, so callers
+    # keeping parsed results of the last response can send a conditional
+    # request, NotModified is raised when the server answers 304
+    headers = {}
+    if validators:
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+    return headers
+
+
+def update_validators(validators, response):
+    if validators is not None:
+        validators.clear()
+        validators.update({k: response.headers[k]
+                           for k in ('ETag', 'Last-Modified')
+                           if k in response.headers})
+
+
+def http_get(uri, validators=None):
+    with HOST_LIMITER.limit(uri):
+        start = time.perf_counter()
+        r = SESSION.get(uri, headers=conditional_headers(validators))
+        METRICS.add_uri(uri, r.status_code, r.elapsed.total_seconds(),
+                        time.perf_counter() - start, len(r.content))
+        if validators and r.status_code == requests.codes.not_modified:
+            raise NotModified(uri)
+        r.raise_for_status()
+        # a redirect which is not followed has no page to parse either
+        if r.status_code != requests.codes.ok:
+            raise FetchError('CAN NOT GET {}, status code {}'.format(
+                uri, r.status_code))
+        update_validators(validators, r)
+        return r
+
+
+def http_stream(uri, chunk_size=CHUNK_SIZE, validators=None):
+    # hold the host slot until the whole body is consumed, only the time
+    # waiting for the network is counted for the URI, not the time the
+    # caller spends on each chunk
+    with HOST_LIMITER.limit(uri):
+        start = time.perf_counter()
+        seconds, size = 0.0, 0
+        with SESSION.get(uri, stream=True,
+                         headers=conditional_headers(validators)) as r:
+            seconds += time.perf_counter() - start
+            try:
+                if validators and \
+                        r.status_code == requests.codes.not_modified:
+                    raise NotModified(uri)
+                if r.status_code != requests.codes.ok:
+                    raise FetchError('CAN NOT GET {}, status code {}'.format(
+                        uri, r.status_code))
+                update_validators(validators, r)
+                chunks = r.iter_content(chunk_size)
+                while True:
+                    start = time.perf_counter()
+                    chunk = next(chunks, None)
+                    seconds += time.perf_counter() - start
+                    if chunk is None:
+                        break
+                    size += len(chunk)
+                    yield chunk
+            finally:
+                METRICS.add_uri(uri, r.status_code,
+                                r.elapsed.total_seconds(), seconds, size)
 
 
 class FormatInput(dict):
@@ -112,10 +708,37 @@ class FormatInput(dict):
         return dict.__setitem__(self, name, value)
 
 
+class RepositoryMap:
+    # openEuler version to URI template of its repo, compiled once from the
+    # repositories of config file, URIs of OpenStack versions in overrides
+    # are used instead of the template of their openEuler version
+    def __init__(self, repositories):
+        self._index = {}
+        for repository in repositories:
+            overrides = dict(repository.get('overrides') or {})
+            for openeuler_version in repository['versions']:
+                if str(openeuler_version) in self._index:
+                    raise ValueError('openEuler {} is in more than one '
+                                     'repository'.format(openeuler_version))
+                self._index[str(openeuler_version)] = (repository['uri'],
+                                                       overrides)
+
+    @classmethod
+    def load(cls, path=DEFAULT_REPO_CONFIG):
+        with open(path) as f:
+            return cls(yaml.safe_load(f)['repositories'])
+
+    def uri(self, openeuler_version, openstack_version):
+        uri, overrides = self._index[openeuler_version]
+        return overrides.get(openstack_version, uri)
+
+
 class ReleasesConfig:
-    def __init__(self, content):
+    def __init__(self, content, arches=(AARCH64,), repositories=None):
         if not isinstance(content, str):
             raise RuntimeError('Input format error')
+        if repositories is None:
+            repositories = RepositoryMap.load()
         self.releases = [r.strip() for r in content.split(',') if r]
         self.releases_config = {}
         for release in self.releases:
@@ -123,18 +746,16 @@ class ReleasesConfig:
             self.releases_config[release] = {}
             self.releases_config[release]['openeuler_ver'] = openeuler_version
             self.releases_config[release]['rpm_os_ver_uri'] = []
+            # arch of each URI in rpm_os_ver_uri
+            self.releases_config[release]['rpm_os_ver_arch'] = []
             self.releases_config[release]['openstack_ver'] = openstack_version
             self.releases_config[release]['os_ver_uri'] = [
                 OS_URI.format(openstack_version), ]
             # Get URL template
-            for _to_version_tuple in RPM_OS_URI_MAPPING.keys():
-                if openeuler_version in _to_version_tuple:
-                    _url = RPM_OS_URI_MAPPING[_to_version_tuple]
-                    if isinstance(_url, dict):
-                        _url = _url[openstack_version]
-                    break
-            # openeuler_version not in RPM_OS_URI_MAPPING
-            else:
+            try:
+                _url = repositories.uri(openeuler_version, openstack_version)
+            # openeuler_version not in repositories
+            except KeyError:
                 # openstack vs openstack
                 # self.releases_config[release]['os_ver_uri'].append(
                 #     OS_URI.format(openeuler_version))
@@ -155,20 +776,33 @@ class ReleasesConfig:
                 )
 
                 format_input.os_version = openstack_version.capitalize()
-                # aarch64
-                self.releases_config[release]['rpm_os_ver_uri'].append(
-                    _url.format(**format_input))
-                # noarch
-                # format_input.aarch_option = NOARCH
-                # self.releases_config[release]['rpm_os_ver_uri'].append(
-                #     _url.format(**format_input))
             # openEuler vs openstack
             else:
                 _openstack_version = openstack_version.capitalize() \
                     if OPENEULER_REPO_DOMAIN in _url else openstack_version
                 format_input.os_version = _openstack_version
-                self.releases_config[release]['rpm_os_ver_uri'].append(
-                    _url.format(**format_input))
+            for arch, aarch, aarch_option in self.arch_options(_url, arches):
+                format_input.aarch = aarch
+                format_input.aarch_option = aarch_option
+                _uri = _url.format(**format_input)
+                if _uri not in self.releases_config[release][
+                        'rpm_os_ver_uri']:
+                    self.releases_config[release]['rpm_os_ver_uri'].append(
+                        _uri)
+                    self.releases_config[release]['rpm_os_ver_arch'].append(
+                        arch)
+
+    @staticmethod
+    def arch_options(_url, arches):
+        # yield (arch, aarch, aarch_option) to format URI of each arch,
+        # noarch packages are in Packages/ of every arch, only repos with
+        # {aarch_option} in URI have them in a directory of their own
+        binary_arches = [arch for arch in arches if arch != NOARCH] or \
+            [AARCH64]
+        for arch in binary_arches:
+            yield arch, arch, arch
+        if NOARCH in arches and '{aarch_option}' in _url:
+            yield NOARCH, binary_arches[0], NOARCH
 
 
 class Renderer:
@@ -177,90 +811,354 @@ class Renderer:
         self.file_format = file_format
         self.file_name = file_name
         self.template = template
-        self.path = os.path.abspath(os.path.dirname(sys.argv[0]))
-        self.template_path = "{}/templates/".format(self.path)
+        # data files of releases rendered in this run, other ones in the
+        # data directory are left from releases not checked any more
+        self._data_files = set()
+        self._output = None
+        self._count = 0
+
+    def open(self):
+        # if file name is not set, then output print to stdout
+        if self.file_name is None:
+            self._output = sys.stdout
+        else:
+            # output is written to a temporary file, which replaces the
+            # output file when it is complete and committed
+            self._output = tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(os.path.abspath(self.file_name)),
+                delete=False)
+        if "json" == self.file_format:
+            self._output.write("{")
+
+    @staticmethod
+    def txt_lines(release, compared_data):
+        yield "Release: {}\n\n".format(release)
+        yield "{:<30} {:<15} {:<15} {:<15}\n\n".format(
+            'Package name', 'OpenStack version', 'openEuler version', 'Status')
+        for pkg_name, pkg_info in compared_data['data'].items():
+            yield "{:<30} {:<15} {:<15} {:<15}\n".format(
+                pkg_name,
+                pkg_info['base_package_version'],
+                str(pkg_info['comparison_package_version']),
+                pkg_info['status'])
+        yield "\n"
+
+    def add(self, release, compared_data):
+        if "txt" == self.file_format:
+            self._output.writelines(self.txt_lines(release, compared_data))
+        elif "json" == self.file_format:
+            self._output.write("{}\n{}: {}".format(
+                "," if self._count else "", json.dumps(release),
+                json.dumps(compared_data)))
+        elif "ndjson" == self.file_format:
+            self._output.write(json.dumps(
+                dict(release=release, **compared_data)) + "\n")
+        elif "pages" == self.file_format:
+            # the index only keeps what is shown before the table is loaded
+            self.data[release] = dict(
+                overall_status=compared_data['overall_status'],
+                apt=compared_data['apt'],
+                packages=len(compared_data['data']),
+                uri='{}/{}'.format(PAGES_DATA_DIR, urllib.parse.quote(
+                    self.write_data(release, compared_data))))
+        else:
+            self.data[release] = compared_data
+        self._count += 1
+
+    def write_data(self, release, compared_data):
+        name = '{}.json.gz'.format(release.replace('/', '_'))
+        directory = os.path.join(
+            os.path.dirname(os.path.abspath(self.file_name)), PAGES_DATA_DIR)
+        path = os.path.join(directory, name)
+        # gzip without timestamp, so unchanged data gives the same file,
+        # which is left untouched and stays cached by browsers
+        body = gzip.compress(json.dumps(compared_data).encode(), mtime=0)
+        self._data_files.add(name)
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == body:
+                    return name
+        except FileNotFoundError:
+            os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+            f.write(body)
+        os.chmod(f.name, FILE_MODE)
+        os.replace(f.name, path)
+        return name
+
+    def close(self, commit=True):
+        if self.file_format in ("html", "pages") and commit:
+            self.stream().dump(self._output)
+        elif "json" == self.file_format and commit:
+            # a failed run printed to stdout is left an unfinished object,
+            # so it is not taken for complete results
+            self._output.write("\n}\n")
+        if self._output is sys.stdout:
+            self._output.flush()
+            return
+        self._output.close()
+        if commit:
+            os.chmod(self._output.name, FILE_MODE)
+            os.replace(self._output.name, self.file_name)
+            if "pages" == self.file_format:
+                self.remove_stale_data()
+        else:
+            os.remove(self._output.name)
+
+    def remove_stale_data(self):
+        directory = os.path.join(
+            os.path.dirname(os.path.abspath(self.file_name)), PAGES_DATA_DIR)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith('.json.gz') and name not in self._data_files:
+                os.remove(os.path.join(directory, name))
 
     def render(self):
+        data, self.data = self.data, {}
+        self.open()
+        for release, compared_data in data.items():
+            self.add(release, compared_data)
+        self.close()
+
+    def dumps(self):
         output = ""
         if "txt" == self.file_format:
-            for release, pkg_vers_data in self.data.items():
-                output += "Release: {}\n\n".format(release)
-                output += "{:<30} {:<15} {:<15} {:<15}\n\n" \
-                    .format('Package name',
-                            'OpenStack version',
-                            'openEuler version',
-                            'Status')
-                for _value in pkg_vers_data.values():
-                    for pkg_name, pkg_info in _value['data'].items():
-                        output += "{:<30} {:<15} {:<15} {:<15}\n".format(
-                            pkg_name,
-                            pkg_info['base_package_version'],
-                            str(pkg_info['comparison_package_version']),
-                            pkg_info['status'])
-                output += "\n"
-        if "html" == self.file_format:
-            sha_tz = datetime.timezone(
-                datetime.timedelta(hours=8),
-                name='Asia/Shanghai',
-            )
-            utc_now = datetime.datetime.utcnow().replace(
-                tzinfo=datetime.timezone.utc)
-            xian_now = utc_now.astimezone(sha_tz)
-            output = jinja2.Environment(
-                loader=jinja2.FileSystemLoader(
-                    self.template_path)).get_template(self.template).render(
-                data=self.data,
-                time=xian_now.strftime("%Y.%m.%d %H:%M:%S %Z"))
-        # if file name is not set,
-        # then file format is None and output print to stdout
-        if self.file_name is None:
-            print(output)
-        else:
-            if os.path.exists(self.file_name):
-                os.remove(self.file_name)
-            with open(self.file_name, 'w') as f:
-                f.write(output)
+            output = "".join(
+                line for release, compared_data in self.data.items()
+                for line in self.txt_lines(release, compared_data))
+        if self.file_format in ("html", "pages"):
+            output = "".join(self.stream())
+        return output
+
+    def stream(self):
+        # the template is compiled once per process and generated piece by
+        # piece, so the whole page is never held in memory
+        sha_tz = datetime.timezone(
+            datetime.timedelta(hours=8),
+            name='Asia/Shanghai',
+        )
+        utc_now = datetime.datetime.utcnow().replace(
+            tzinfo=datetime.timezone.utc)
+        xian_now = utc_now.astimezone(sha_tz)
+        return JINJA_ENV.get_template(self.template).stream(
+            data=self.data,
+            time=xian_now.strftime("%Y.%m.%d %H:%M:%S %Z"))
+
+
+class LinkScanner:
+    # find links in HTML fed chunk by chunk, a match may span lines, so the
+    # text from the last "<" after the last match is carried over to the
+    # next chunk, the result is the same as scanning the whole page at once
+    def __init__(self, pattern=RPM_LINK_PATTERN):
+        self.pattern = pattern
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+
+    def feed(self, chunk, final=False):
+        self._buffer += self._decoder.decode(chunk, final)
+        end = 0
+        for match in self.pattern.finditer(self._buffer):
+            end = match.end()
+            yield match.group(1)
+        tag = self._buffer.rfind('<')
+        self._buffer = self._buffer[max(end, tag) if tag >= 0
+                                    else len(self._buffer):]
+
+
+class RepodataVersions:
+    # primary checksum and parsed packages of each repo already read in this
+    # process, {repo_uri: (checksum, results)}
+    _parsed = {}
+    _lock = threading.Lock()
+
+    def __init__(self, rpm_os_ver_uri, cache_dir=None, validators=None):
+        # .../{aarch}/Packages/ -> .../{aarch}/
+        self.repo_uri = urllib.parse.urljoin(rpm_os_ver_uri, '../')
+        self.cache_dir = cache_dir
+        # validators of repomd.xml
+        self.validators = validators
+
+    def _cache_path(self):
+        return os.path.join(self.cache_dir, 'repodata-{}.json'.format(
+            hashlib.sha256(self.repo_uri.encode()).hexdigest()))
+
+    def _load(self, checksum):
+        with self._lock:
+            if self._parsed.get(self.repo_uri, (None, ))[0] == checksum:
+                return self._parsed[self.repo_uri][1]
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path()) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached['checksum'] != checksum:
+            return None
+        with self._lock:
+            self._parsed[self.repo_uri] = (checksum, cached['results'])
+        return cached['results']
+
+    def _store(self, checksum, results):
+        with self._lock:
+            self._parsed[self.repo_uri] = (checksum, results)
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=self.cache_dir,
+                                         delete=False) as f:
+            json.dump(dict(checksum=checksum, results=results), f)
+        os.replace(f.name, self._cache_path())
+
+    def primary(self):
+        repomd_uri = urllib.parse.urljoin(self.repo_uri,
+                                          'repodata/repomd.xml')
+        r = http_get(repomd_uri, self.validators)
+        for data in ET.fromstring(r.content).iterfind('repo:data',
+                                                      REPOMD_NS):
+            if data.get('type') == 'primary':
+                return (urllib.parse.urljoin(
+                    self.repo_uri,
+                    data.find('repo:location', REPOMD_NS).get('href')),
+                    data.find('repo:checksum', REPOMD_NS).text)
+        raise RuntimeError('No primary metadata in {}'.format(repomd_uri))
+
+    @staticmethod
+    def decompress(decompressor, chunks, chunk_size=CHUNK_SIZE):
+        # yield at most chunk_size bytes at a time, a highly compressed chunk
+        # is drained piece by piece instead of being expanded at once
+        for chunk in chunks:
+            yield decompressor.decompress(chunk, chunk_size)
+            # zlib keeps input not yet decompressed in unconsumed_tail, bz2
+            # and lzma buffer it and need no input until it is consumed
+            if hasattr(decompressor, 'unconsumed_tail'):
+                while decompressor.unconsumed_tail:
+                    yield decompressor.decompress(
+                        decompressor.unconsumed_tail, chunk_size)
+            else:
+                while not decompressor.needs_input and not decompressor.eof:
+                    yield decompressor.decompress(b'', chunk_size)
+        if hasattr(decompressor, 'flush'):
+            yield decompressor.flush()
+
+    def packages(self, primary_uri):
+        # yield (name, epoch, version, release, arch, href) of every package,
+        # primary is decompressed and parsed chunk by chunk, each package
+        # element is dropped once read, so memory does not grow with the
+        # size of the repo
+        _, ext = os.path.splitext(urllib.parse.urlsplit(primary_uri).path)
+        if ext not in PRIMARY_DECOMPRESSORS:
+            raise RuntimeError('Unsupported primary metadata {}'.format(
+                primary_uri))
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        root = None
+        for chunk in self.decompress(PRIMARY_DECOMPRESSORS[ext](),
+                                     http_stream(primary_uri)):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                if event != 'end' or elem.tag != PRIMARY_PACKAGE_TAG:
+                    continue
+                arch = elem.findtext('common:arch', namespaces=PRIMARY_NS)
+                if arch != 'src':
+                    ver = elem.find('common:version', PRIMARY_NS)
+                    yield (elem.findtext('common:name',
+                                         namespaces=PRIMARY_NS),
+                           ver.get('epoch'), ver.get('ver'), ver.get('rel'),
+                           arch, urllib.parse.urljoin(
+                               self.repo_uri,
+                               elem.find('common:location', PRIMARY_NS)
+                               .get('href')))
+                root.clear()
+        parser.close()
+
+    @property
+    def rpm_versions(self):
+        primary_uri, checksum = self.primary()
+        results = self._load(checksum)
+        if results is None:
+            results = dict()
+            for name, epoch, ver, rel, arch, href in self.packages(
+                    primary_uri):
+                RPMVersions.update_results(
+                    results, name, dict(version=ver, href=href, epoch=epoch,
+                                        release=rel, arch=arch))
+            self._store(checksum, results)
+        return results
 
 
 class RPMVersions:
-    def __init__(self, _rpm_os_ver_uri_list, openeuler_ver):
+    def __init__(self, _rpm_os_ver_uri_list, openeuler_ver,
+                 backend=DEFAULT_RPM_BACKEND, cache_dir=None,
+                 validators=None):
         self.rpm_os_ver_uri_list = _rpm_os_ver_uri_list
         self.openeuler_ver = openeuler_ver
+        self.backend = backend
+        self.cache_dir = cache_dir
+        # {uri: validators} of URIs to fetch with a conditional request
+        self.validators = validators or {}
+
+    @staticmethod
+    def update_results(results, pkg_name, pkg_info):
+        # check if package with version are in results,
+        # and check for higher version
+        if pkg_name not in results:
+            results[pkg_name] = pkg_info
+        # if current version < new version, then update it
+        elif RPMVersions.evr_key(results[pkg_name]) \
+                < RPMVersions.evr_key(pkg_info):
+            results[pkg_name] = pkg_info
+
+    @staticmethod
+    def evr_key(pkg_info):
+        return rpmvercmp.evr_key(pkg_info.get('epoch'), pkg_info['version'],
+                                 pkg_info.get('release'))
 
     @property
     def rpm_versions(self):
         results = dict()
         for _rpm_os_ver_uri in self.rpm_os_ver_uri_list:
-            r = requests.get(_rpm_os_ver_uri, **REQUESTS_ARGS)
-            if r.status_code != requests.codes.ok:
+            if self.backend == 'repodata':
+                for pkg_name, pkg_info in RepodataVersions(
+                        _rpm_os_ver_uri, self.cache_dir,
+                        self.validators.get(_rpm_os_ver_uri)
+                ).rpm_versions.items():
+                    self.update_results(results, pkg_name, pkg_info)
+                continue
+            try:
+                for _link in self.links(
+                        _rpm_os_ver_uri,
+                        self.validators.get(_rpm_os_ver_uri)):
+                    pkg_link = _rpm_os_ver_uri + _link
+                    # get name and package information from link
+                    pkg_full_name, pkg_rel_arch = _link.rsplit('-', 1)
+                    pkg_name, pkg_ver = pkg_full_name.rsplit('-', 1)
+                    pkg_rel = pkg_rel_arch.rsplit('.', 2)[0]
+                    self.update_results(results, pkg_name,
+                                        dict(version=pkg_ver, href=pkg_link,
+                                             release=pkg_rel))
+            except FetchError as e:
                 raise RuntimeError('CAN NOT GET openEuler {} from {}'.format(
-                        self.openeuler_ver, _rpm_os_ver_uri))
-            uri_content = r.content.decode()
-            # get all links, which ends .rpm from HTML, work for oepkg and
-            # openEuler EPOL page format
-            links = re.findall(r'<a\shref="(.*?\.rpm)"[\s>]', uri_content)
-            for _link in links:
-                pkg_link = _rpm_os_ver_uri + _link
-                # get name and package information from link
-                pkg_full_name, _ = _link.rsplit('-', 1)
-                pkg_name, pkg_ver = pkg_full_name.rsplit('-', 1)
-                # check if package with version are in results,
-                # and check for higher version
-                if pkg_name not in results:
-                    pkg_info = dict(version=pkg_ver, href=pkg_link)
-                    results[pkg_name] = pkg_info
-                else:
-                    # if current version < new version, then update it
-                    if version.parse(results[pkg_name]['version']) \
-                            < version.parse(pkg_ver):
-                        results[pkg_name].update(version=pkg_ver)
+                        self.openeuler_ver, _rpm_os_ver_uri)) from e
         return results
 
+    @staticmethod
+    def links(_rpm_os_ver_uri, validators=None):
+        # links are parsed while the listing is still downloading
+        scanner = LinkScanner()
+        for chunk in http_stream(_rpm_os_ver_uri, validators=validators):
+            yield from scanner.feed(chunk)
+        yield from scanner.feed(b'', final=True)
+
 
 class UpstreamVersions:
-    def __init__(self, _os_ver_uri, openstack_ver):
-        self.url_os_content = requests.get(_os_ver_uri,
-                                           **REQUESTS_ARGS).content.decode()
+    def __init__(self, _os_ver_uri, openstack_ver, validators=None):
+        self.url_os_content = http_get(_os_ver_uri,
+                                       validators).content.decode()
         self.openstack_ver = openstack_ver
 
     @property
@@ -294,103 +1192,474 @@ class UpstreamVersions:
             else:
                 # if current versions < new version, then update it
                 if (pkg_ver in EOL_PKG_SUFFIX or
-                        version.parse(results[pkg_name]['version']) <
-                        version.parse(pkg_ver)):
+                        parse_version(results[pkg_name]['version']) <
+                        parse_version(pkg_ver)):
                     results[pkg_name].update(version=pkg_ver, href=pkg_link)
         return results
 
 
-class VersionsComparator:
-    def __init__(self, base_data, to_comparison_data):
-        self._base_data = base_data
-        self._comp_data = to_comparison_data
+class FetchRegistry:
+    # one future per fetched URI in a run, releases sharing an upstream page
+    # or a repo get the same in-flight request and the same parsed result
+    def __init__(self, executor):
+        self._executor = executor
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(fn, *args)
+            return self._futures[key]
+
+
+class FetchEngine:
+    def __init__(self, releases_config, workers=DEFAULT_WORKERS,
+                 rpm_backend=DEFAULT_RPM_BACKEND, cache_dir=None):
+        self.releases_config = releases_config
+        self.workers = workers
+        self.rpm_backend = rpm_backend
+        self.cache_dir = cache_dir
+        # content hash of each fetched and parsed index
+        self.digests = {}
+        # parsed results of each URI with validators of its response, kept
+        # across fetch() calls, a URI is parsed again only if it changed
+        self._parsed = {}
+
+    def _parse(self, uri, parse):
+        # parse(validators) fetches the URI, conditionally if there are
+        # parsed results of it already
+        validators, results = self._parsed.get(uri, (None, None))
+        validators = dict(validators or {})
+        try:
+            with METRICS.parse():
+                results = parse(validators)
+        except NotModified:
+            pass
+        else:
+            self._parsed[uri] = (validators, results)
+            self.digests[uri] = digest(results)
+        METRICS.add_stage('parse', 0, packages=len(results))
+        return results
+
+    def _upstream(self, _os_ver_uri, openstack_ver):
+        return self._parse(_os_ver_uri, lambda validators: UpstreamVersions(
+            _os_ver_uri, openstack_ver, validators).upstream_versions)
+
+    def _rpm(self, _rpm_os_ver_uri, openeuler_ver):
+        return self._parse(_rpm_os_ver_uri, lambda validators: RPMVersions(
+            [_rpm_os_ver_uri], openeuler_ver, self.rpm_backend,
+            self.cache_dir, {_rpm_os_ver_uri: validators}).rpm_versions)
+
+    def release_digest(self, release):
+        # hash of all inputs of a release, valid once the release is fetched
+        _release_config = self.releases_config.releases_config[release]
+        return digest([self.digests[uri] for uri in
+                       _release_config['os_ver_uri'][:1] +
+                       _release_config['rpm_os_ver_uri']] +
+                      [UPSTREAM_FILTER.pattern, RESULT_SCHEMA_VERSION])
+
+    @staticmethod
+    def _merge(rpm_results, arches=()):
+        # openEuler vs OpenStack
+        if not rpm_results:
+            # else:
+            #     # OpenStack vs OpenStack
+            #     com_openstack_uri = _release_config['os_ver_uri'][-1]
+            #     return UpstreamVersions(
+            #         com_openstack_uri).upstream_versions
+            return None
+        if len(rpm_results) == 1:
+            return rpm_results[0]
+        results = dict()
+        # version of each package in each arch, the highest version is
+        # compared and arches not having it are flagged as arch skew
+        arch_versions = defaultdict(dict)
+        for arch, _results in zip(arches, rpm_results):
+            for pkg_name, pkg_info in _results.items():
+                RPMVersions.update_results(results, pkg_name, pkg_info)
+                arch_versions[pkg_name][arch] = '-'.join(
+                    filter(None, (pkg_info['version'],
+                                  pkg_info.get('release'))))
+        binary_arches = set(arches) - {NOARCH}
+        for pkg_name, versions in arch_versions.items():
+            results[pkg_name] = dict(
+                results[pkg_name], arches=versions,
+                arch_skew=len(set(versions.values())) > 1 or bool(
+                    binary_arches & versions.keys() and
+                    binary_arches - versions.keys()))
+        return results
+
+    def fetch(self, releases=None):
+        # fetch upstream pages and RPM indexes of all releases at the same
+        # time, yield (release, openstack_data, openeuler_data) as soon as
+        # both sides of a release are in
+        if releases is None:
+            releases = self.releases_config.releases
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers) as executor:
+            registry = FetchRegistry(executor)
+            release_futures = {}
+            pending = {}
+            waiting = defaultdict(list)
+            for release in dict.fromkeys(releases):
+                _release_config = self.releases_config.releases_config[
+                    release]
+                upstream_future = registry.submit(
+                    ('upstream', _release_config['os_ver_uri'][0]),
+                    self._upstream, _release_config['os_ver_uri'][0],
+                    _release_config['openstack_ver'])
+                rpm_futures = [
+                    registry.submit(('rpm', _rpm_os_ver_uri), self._rpm,
+                                    _rpm_os_ver_uri,
+                                    _release_config['openeuler_ver'])
+                    for _rpm_os_ver_uri in _release_config['rpm_os_ver_uri']]
+                release_futures[release] = (upstream_future, rpm_futures)
+                futures = set([upstream_future] + rpm_futures)
+                pending[release] = len(futures)
+                for future in futures:
+                    waiting[future].append(release)
+            for future in concurrent.futures.as_completed(waiting):
+                if future.exception() is not None:
+                    for _future in waiting:
+                        _future.cancel()
+                    _release_config = self.releases_config.releases_config[
+                        waiting[future][0]]
+                    print('openstack_ver_uri: {}\nopeneuler_ver_uri: {}\n'
+                          .format(_release_config['os_ver_uri'][0],
+                                  _release_config['rpm_os_ver_uri']))
+                    raise future.exception()
+                for release in waiting[future]:
+                    pending[release] -= 1
+                    if pending[release]:
+                        continue
+                    upstream_future, rpm_futures = release_futures[release]
+                    yield (release, upstream_future.result(),
+                           self._merge([rpm_future.result()
+                                        for rpm_future in rpm_futures],
+                                       self.releases_config.releases_config[
+                                           release]['rpm_os_ver_arch']))
+
+
+class DeltaState:
+    # state of the last run, compared data of every release with hash of its
+    # inputs, and hash of the output
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = dict(releases={}, output=None)
+        # compared data of the last run, to diff the new results against
+        self.previous = {release: _release_state['compared_data']
+                         for release, _release_state in
+                         self.state['releases'].items()}
+        self.skipped = []
+        self.recomputed = []
+        self.changed = []
+        self.transitions = []
+
+    def compared_data(self, release, inputs_digest):
+        _release_state = self.state['releases'].get(release)
+        if _release_state is None or \
+                _release_state['inputs'] != inputs_digest:
+            return None
+        return _release_state['compared_data']
+
+    def update(self, release, inputs_digest, compared_data, skipped):
+        self.state['releases'][release] = dict(inputs=inputs_digest,
+                                               compared_data=compared_data)
+        if skipped:
+            self.skipped.append(release)
+        else:
+            self.recomputed.append(release)
+
+    def diff(self, release, compared_data):
+        # status transitions of packages since the last run, records of
+        # packages are looked up by name in the last results, so a release
+        # is one pass over its packages, releases with any change are added
+        # to changed
+        previous = self.previous.get(release)
+        if previous is None:
+            self.changed.append(release)
+            return
+        previous_data = previous['data']
+        changed = previous_data.keys() != compared_data['data'].keys() or \
+            any(previous.get(key) != compared_data.get(key)
+                for key in previous.keys() | compared_data.keys()
+                if key != 'data')
+        for pkg_name, pkg_info in compared_data['data'].items():
+            previous_info = previous_data.get(pkg_name, {})
+            if previous_info == pkg_info:
+                continue
+            changed = True
+            if previous_info.get('status') != pkg_info['status']:
+                self.transitions.append(dict(
+                    release=release, package=pkg_name,
+                    previous_status=previous_info.get('status'),
+                    status=pkg_info['status'],
+                    base_package_version=pkg_info['base_package_version'],
+                    comparison_package_version=pkg_info[
+                        'comparison_package_version']))
+        for pkg_name in previous_data.keys() - compared_data['data'].keys():
+            self.transitions.append(dict(
+                release=release, package=pkg_name,
+                previous_status=previous_data[pkg_name]['status'],
+                status=None, base_package_version=None,
+                comparison_package_version=None))
+        if changed:
+            self.changed.append(release)
+
+    def output_changed(self, releases):
+        # output is rendered again only when a release changed or the
+        # releases in it are not the same as last time
+        changed = bool(self.changed) or self.state['output'] != releases
+        self.state['output'] = releases
+        return changed
+
+    def changelog(self, file_format='json'):
+        if 'json' == file_format:
+            return json.dumps(self.transitions) + "\n"
+        return "".join(
+            "{:<30} {:<30} {:<10} -> {:<10} {} {}\n".format(
+                transition['release'], transition['package'],
+                transition['previous_status'] or '-',
+                transition['status'] or '-',
+                transition['base_package_version'] or '-',
+                transition['comparison_package_version'] or '-')
+            for transition in self.transitions)
+
+    def write_changelog(self, path, file_format='json'):
+        if path == STDOUT_FILE_NAME:
+            click.echo(self.changelog(file_format), nl=False)
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory,
+                                         delete=False) as f:
+            f.write(self.changelog(file_format))
+        os.chmod(f.name, FILE_MODE)
+        os.replace(f.name, path)
+
+    def save(self):
+        # drop hashes of indexes written by older versions
+        self.state.pop('indexes', None)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=directory,
+                                         delete=False) as f:
+            json.dump(self.state, f)
+        os.chmod(f.name, FILE_MODE)
+        os.replace(f.name, self.path)
+
+
+class History:
+    # compared data of every run kept in SQLite, one row per release and
+    # one per package of each release, a whole run is one transaction
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(HISTORY_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
 
     @staticmethod
-    def get_pair(base_pkg_name, from_data):
-        def sanitize_base_pkg_name(_base_pkg_name, str_to_replace):
-            default_replace = OPENEULER_DEFAULT_REPLACE.sub("-",
-                                                            _base_pkg_name)
-            cases = {
-                # Check between openstack versions
-                "*": _base_pkg_name,
-                # Check between openstack and openEuler packages, package name
-                # should to be transformed
-                "-": default_replace,
-                "python-to2-": default_replace.replace("python-", "python2-"),
-                "python-to3-": default_replace.replace("python-", "python3-"),
-                "+python2-": "python2-{}".format(default_replace),
-                "+python3-": "python3-{}".format(default_replace),
-                "+openstack-": "openstack-{}".format(default_replace)
-            }
-            return cases[str_to_replace]
-
-        def is_in_comp_data(_base_pkg_name, _replacement):
-            if sanitize_base_pkg_name(_base_pkg_name,
-                                      replacement) in from_data:
-                return sanitize_base_pkg_name(_base_pkg_name, replacement)
-            return False
-
-        # try find modified to comparison package name in to comp. packages
-        replacements = ["*",
-                        "-",
-                        "python-to2-",
-                        "python-to3-",
-                        "+python2-",
-                        "+python3-",
-                        "+openstack-"]
-        for replacement in replacements:
-            if is_in_comp_data(base_pkg_name, replacement):
-                return sanitize_base_pkg_name(base_pkg_name, replacement)
+    def now():
+        return datetime.datetime.now(datetime.timezone.utc).strftime(
+            '%Y-%m-%dT%H:%M:%S.%fZ')
 
-    @property
-    def compared_data(self):
-        # base_ver is OpenStack upstream
-        # comp_ver is openEuler
-        def set_status(base_ver, comp_ver):
-            if "+" in comp_ver:
-                comp_ver = comp_ver.split('+')[0]
-            if "~" in comp_ver:
-                if "~rc" or "~b" in comp_ver:
-                    comp_ver_arr = comp_ver.split('~')
-                    comp_ver = "{}.0{}".format(comp_ver_arr[0],
-                                               comp_ver_arr[1])
-                else:
-                    comp_ver = comp_ver.split('~')[0]
-            if base_ver in EOL_PKG_SUFFIX:
-                return STATUS_EOL
-            elif version.parse(base_ver) == version.parse(comp_ver):
-                return STATUS_OK
-            elif version.parse(base_ver) > version.parse(comp_ver):
-                return STATUS_OUTDATED
-            elif version.parse(base_ver) < version.parse(comp_ver):
-                return STATUS_MISMATCH
+    def append(self, ver_data, run_time=None):
+        if run_time is None:
+            run_time = self.now()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO releases VALUES (?, ?, ?, ?)',
+                [(release, run_time, compared_data['overall_status'],
+                  compared_data['paired'])
+                 for release, compared_data in ver_data.items()])
+            conn.executemany(
+                'INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?)',
+                [(release, package, run_time,
+                  pkg_info['base_package_version'],
+                  pkg_info['comparison_package_version'], pkg_info['status'])
+                 for release, compared_data in ver_data.items()
+                 for package, pkg_info in compared_data['data'].items()])
+
+    def transitions(self, package, release=None, status=None):
+        # (release, run_time, previous status, status) of every run where
+        # the status of package changed, or became the given status
+        query = '''
+            SELECT release, run_time, previous, status FROM (
+                SELECT release, run_time, status, LAG(status) OVER (
+                    PARTITION BY release ORDER BY run_time) AS previous
+                FROM packages WHERE package = ? AND
+                    (? IS NULL OR release = ?))
+            WHERE (previous IS NULL OR previous != status) AND
+                (? IS NULL OR status = ?)
+            ORDER BY release, run_time'''
+        with self._connect() as conn:
+            return conn.execute(query, (package, release, release,
+                                        status, status)).fetchall()
+
+    def status_counts(self, release=None):
+        # (release, run_time, {status: count}) of every run
+        query = '''
+            SELECT release, run_time, status, COUNT(*) FROM packages
+            WHERE ? IS NULL OR release = ?
+            GROUP BY release, run_time, status
+            ORDER BY release, run_time'''
+        counts = OrderedDict()
+        with self._connect() as conn:
+            for _release, run_time, status, count in conn.execute(
+                    query, (release, release)):
+                counts.setdefault((_release, run_time), {})[status] = count
+        return [(_release, run_time, _counts)
+                for (_release, run_time), _counts in counts.items()]
+
+
+class PairingIndex:
+    # map upstream package name to openEuler package names in order of
+    # preference, which are found by applying PAIRING_RULES to the upstream
+    # name, the names of each upstream package are looked up once, then
+    # each pairing is a dict lookup
+    def __init__(self, comp_pkg_names, rules=PAIRING_RULES):
+        self._names = frozenset(comp_pkg_names)
+        self._rules = rules
+        self._index = {}
+
+    def candidates(self, base_pkg_name):
+        # Check between openstack versions
+        yield base_pkg_name
+        # Check between openstack and openEuler packages, package name
+        # should to be transformed
+        default_replace = OPENEULER_DEFAULT_REPLACE.sub("-", base_pkg_name)
+        for old, new in self._rules:
+            if old:
+                yield default_replace.replace(old, new)
             else:
-                return STATUS_NONE
+                yield new + default_replace
+
+    def get(self, base_pkg_name, claimed=()):
+        comp_pkg_names = self._index.get(base_pkg_name)
+        if comp_pkg_names is None:
+            comp_pkg_names = self._index[base_pkg_name] = [
+                comp_pkg_name for comp_pkg_name in
+                dict.fromkeys(self.candidates(base_pkg_name))
+                if comp_pkg_name in self._names]
+        for comp_pkg_name in comp_pkg_names:
+            if comp_pkg_name not in claimed:
+                return comp_pkg_name
+        return None
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def upstream_rpm_version(base_ver):
+    # OpenStack upstream version as RPM version, pbr writes pre-releases as
+    # X.Y.Z.0rcN, which are packaged as X.Y.Z~rcN
+    match = UPSTREAM_PRE_RELEASE.match(base_ver)
+    if match is None:
+        return base_ver
+    release, pre_release = match.groups()
+    if release.count('.') == 3 and release.endswith('.0'):
+        release = release[:-len('.0')]
+    return '{}~{}'.format(release, pre_release)
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def version_key(ver):
+    # RPM version key without trailing zero components of the release
+    # number, so 2.0 and 2.0.0 are the same version as they are upstream
+    key = rpmvercmp.version_key(ver)
+    release = next((i for i, segment in enumerate(key)
+                    if segment[0] != rpmvercmp.NUMERIC), len(key))
+    end = release
+    while end > 1 and key[end - 1] == (rpmvercmp.NUMERIC, 0):
+        end -= 1
+    return key[:end] + key[release:]
+
+
+def normalize_version(comp_ver):
+    # openEuler version without suffix added after "+" by packagers
+    return comp_ver.split('+')[0]
 
+
+def version_statuses(base_versions, comp_versions):
+    # base_ver is OpenStack upstream
+    # comp_ver is openEuler
+    # statuses of a whole release at once, versions are compared as RPM
+    # versions and the status is picked by the sign of each comparison
+    signs = iter(rpmvercmp.compare(
+        [upstream_rpm_version(base_ver) for base_ver in base_versions
+         if base_ver not in EOL_PKG_SUFFIX],
+        [normalize_version(comp_ver) for base_ver, comp_ver in
+         zip(base_versions, comp_versions)
+         if base_ver not in EOL_PKG_SUFFIX], version_key))
+    return [STATUS_EOL if base_ver in EOL_PKG_SUFFIX else
+            SIGN_STATUS[next(signs)] for base_ver in base_versions]
+
+
+class VersionsComparator:
+    def __init__(self, base_data, to_comparison_data,
+                 pairing_rules=PAIRING_RULES, upstream_filter=None):
+        # comparison never changes the input data, so the same fetched data
+        # can be compared many times, packages already paired in a
+        # comparison are tracked in a claimed set instead of being removed
+        self._base_data = types.MappingProxyType(dict(base_data))
+        self._comp_data = types.MappingProxyType(dict(to_comparison_data))
+        self._pairing = PairingIndex(to_comparison_data, pairing_rules)
+        self._filter = UPSTREAM_FILTER if upstream_filter is None \
+            else upstream_filter
+
+    @property
+    def compared_data(self):
         def filter_upstream(_base_pkg_name):
-            for pattern in UPSTREAM_FILTER_LIST:
-                if pattern.match(_base_pkg_name):
-                    return False
-            return True
+            return self._filter.match(_base_pkg_name) is None
+
+        # pair all packages first, then statuses of the paired packages are
+        # computed for the whole release at once
+        pairs = []
+        claimed = set()
+        for base_pkg_name in filter(filter_upstream, self._base_data.keys()):
+            comp_pkg_name = self._pairing.get(base_pkg_name, claimed)
+            if comp_pkg_name is not None:
+                claimed.add(comp_pkg_name)
+            pairs.append((base_pkg_name, comp_pkg_name))
+        paired_pairs = [(base_pkg_name, comp_pkg_name)
+                        for base_pkg_name, comp_pkg_name in pairs
+                        if comp_pkg_name is not None]
+        statuses = dict(zip(
+            (base_pkg_name for base_pkg_name, _ in paired_pairs),
+            version_statuses(
+                [self._base_data[base_pkg_name]['version']
+                 for base_pkg_name, _ in paired_pairs],
+                [self._comp_data[comp_pkg_name]['version']
+                 for _, comp_pkg_name in paired_pairs])))
 
         result_data = dict()
-        paired = 0
         overall_status = STATUS_NONE
-        for base_pkg_name in filter(filter_upstream, self._base_data.keys()):
-            comp_pkg_name = self.get_pair(base_pkg_name, self._comp_data)
+        for base_pkg_name, comp_pkg_name in pairs:
             base_pkg_ver = self._base_data[base_pkg_name]['version']
             # if to comparison package and base package have pair
             if comp_pkg_name is not None:
-                comp_pkg_info = self._comp_data[comp_pkg_name]
-                comp_pkg_ver = comp_pkg_info['version']
-                status = set_status(base_pkg_ver, comp_pkg_ver)
+                comp_pkg_ver = self._comp_data[comp_pkg_name]['version']
+                status = statuses[base_pkg_name]
                 pkg_info = dict(comparison_package_version=comp_pkg_ver,
                                 base_package_version=base_pkg_ver,
                                 status=status[1], status_id=status[0])
+                # packages merged from many arches
+                if 'arches' in self._comp_data[comp_pkg_name]:
+                    pkg_info.update(
+                        arches=self._comp_data[comp_pkg_name]['arches'],
+                        arch_skew=self._comp_data[comp_pkg_name][
+                            'arch_skew'])
                 if status == STATUS_OUTDATED:
                     overall_status = STATUS_OUTDATED
-                paired += 1
-                del self._comp_data[comp_pkg_name]
             else:
                 pkg_info = dict(comparison_package_version=None,
                                 base_package_version=base_pkg_ver,
@@ -403,62 +1672,487 @@ class VersionsComparator:
                                          operator.getitem(x[1], 'status_id')))
         return dict(overall_status=overall_status[1],
                     overall_status_id=overall_status[0],
-                    paired=paired,
+                    paired=len(paired_pairs),
                     data=result_data)
 
 
-@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+def compare_release(_release_config, openstack_data, openeuler_data):
+    try:
+        start = time.perf_counter()
+        compared_data = VersionsComparator(
+            openstack_data, openeuler_data).compared_data
+        METRICS.add_stage('compare', time.perf_counter() - start,
+                          packages=len(compared_data['data']))
+    except Exception as e:
+        print('openstack_ver_uri: {}\nopeneuler_ver_uri: {}\n'.format(
+            _release_config['os_ver_uri'][0],
+            _release_config['rpm_os_ver_uri']))
+        raise e
+    compared_data['apt'] = _release_config['os_ver_uri'] + \
+        _release_config['rpm_os_ver_uri']
+    return compared_data
+
+
+class ResultStore:
+    # latest comparison of every release, documents served by the HTTP API
+    # are encoded once per update, so polling them costs a dict lookup, the
+    # page of all releases is rendered by render() once a refresh is done
+    def __init__(self, releases):
+        self.releases = list(dict.fromkeys(releases))
+        self.ver_data = {}
+        self.status = {release: dict(updated=None, error=None)
+                       for release in self.releases}
+        self.documents = {}
+        self._lock = threading.Lock()
+        # number of data updates, and the one the served page was rendered
+        # from, so a page rendered from older data never replaces a newer one
+        self._version = 0
+        self._rendered = 0
+
+    @staticmethod
+    def _document(content_type, body):
+        return ('"{}"'.format(hashlib.sha256(body).hexdigest()),
+                content_type, body)
+
+    def update(self, release, compared_data=None, error=None):
+        with self._lock:
+            if error is None:
+                self.ver_data[release] = compared_data
+                self.status[release] = dict(updated=time.time(), error=None)
+                self._version += 1
+            else:
+                self.status[release]['error'] = str(error)
+            documents = dict(self.documents)
+            summary = {_release: dict(
+                self.status[_release],
+                **{k: self.ver_data[_release][k]
+                   for k in ('overall_status', 'paired')
+                   if _release in self.ver_data})
+                for _release in self.releases}
+            documents['/api/releases'] = self._document(
+                'application/json', json.dumps(summary).encode())
+            if error is None:
+                documents['/api/releases/{}'.format(release)] = \
+                    self._document('application/json',
+                                   json.dumps(compared_data).encode())
+            self.documents = documents
+
+    def render(self):
+        # the page is rendered without holding the lock, so the API is
+        # served and updated while it is rendered
+        with self._lock:
+            version = self._version
+            ver_data = {_release: self.ver_data[_release]
+                        for _release in self.releases
+                        if _release in self.ver_data}
+        if not ver_data or version <= self._rendered:
+            return
+        start = time.perf_counter()
+        page = self._document(
+            'text/html; charset=utf-8',
+            Renderer(ver_data, DEFAULT_TEMPLATE, 'html',
+                     None).dumps().encode())
+        METRICS.add_stage('render', time.perf_counter() - start,
+                          packages=sum(len(_ver_data['data'])
+                                       for _ver_data in ver_data.values()))
+        with self._lock:
+            if version > self._rendered:
+                self._rendered = version
+                self.documents = dict(self.documents, **{
+                    '/': page, '/index.html': page})
+
+    def document(self, path):
+        return self.documents.get(path)
+
+
+class ResultHandler(http.server.BaseHTTPRequestHandler):
+    def __init__(self, store, *args, **kwargs):
+        self.store = store
+        super().__init__(*args, **kwargs)
+
+    def do_HEAD(self):
+        self.do_GET(send_body=False)
+
+    def do_GET(self, send_body=True):
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if path == '/metrics':
+            document = ResultStore._document(
+                'text/plain; version=0.0.4; charset=utf-8',
+                METRICS.openmetrics().encode())
+        else:
+            document = self.store.document(path)
+        if document is None:
+            self.send_error(requests.codes.not_found)
+            return
+        etag, content_type, body = document
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(requests.codes.not_modified)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(requests.codes.ok)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+class Scheduler:
+    # refresh every release in its own thread, each refresh is followed by
+    # the interval plus a random jitter, so releases do not hit the mirrors
+    # at the same time, the engine is shared, so a page or index used by
+    # several releases is only parsed again when it changed
+    def __init__(self, releases_config, store, engine,
+                 interval=DEFAULT_REFRESH_INTERVAL,
+                 jitter=DEFAULT_REFRESH_JITTER, on_refresh=None,
+                 history=None):
+        self.releases_config = releases_config
+        self.store = store
+        self.engine = engine
+        self.history = history
+        self.interval = interval
+        self.jitter = jitter
+        self.on_refresh = on_refresh
+        self._stop = threading.Event()
+
+    def refresh(self, release):
+        _release_config = self.releases_config.releases_config[release]
+        started = time.time()
+        try:
+            for _, openstack_data, openeuler_data in self.engine.fetch(
+                    [release]):
+                compared_data = compare_release(
+                    _release_config, openstack_data, openeuler_data)
+                self.store.update(release, compared_data)
+                if self.history is not None:
+                    self.history.append({release: compared_data})
+        except Exception as e:
+            traceback.print_exc()
+            self.store.update(release, error=e)
+        else:
+            self.store.render()
+        METRICS.run_finished(started)
+        if self.on_refresh is not None:
+            self.on_refresh()
+
+    def _loop(self, release):
+        delay = random.uniform(0, self.jitter)
+        while not self._stop.wait(delay):
+            self.refresh(release)
+            delay = self.interval + random.uniform(0, self.jitter)
+
+    def start(self):
+        for release in self.store.releases:
+            threading.Thread(target=self._loop, args=(release, ),
+                             daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def split_arches(ctx, param, value):
+    arches = [arch.strip() for arch in value.split(',') if arch.strip()]
+    for arch in arches:
+        if arch not in ARCHES:
+            raise click.BadParameter('{} is not one of {}'.format(
+                arch, ', '.join(ARCHES)))
+    return tuple(dict.fromkeys(arches)) or (AARCH64,)
+
+
+@click.group(invoke_without_command=True,
+             context_settings=dict(help_option_names=['-h', '--help']))
 @click.option('-r', '--releases', default='22.03-LTS-SP4/train',
               type=click.STRING, required=False, show_default=True,
               help='Comma separated releases with openEuler/OpenStack '
                    'to check, for example: '
                    '22.03-LTS-SP4/wallaby,22.03-LTS-SP4/train')
-@click.option('-n', '--file-name', default='index.html',
-              required=False, show_default=True,
-              help='Output file name of openstack version checker')
+@click.option('-n', '--file-name', required=False,
+              show_default='index.<format>',
+              help='Output file name of openstack version checker, '
+                   '"-" for stdout')
+@click.option('-f', '--format', 'file_format', default=DEFAULT_FILE_TYPE,
+              type=click.Choice(FILE_TYPES), required=False,
+              show_default=True,
+              help='Output format, pages writes an html index and one '
+                   'gzipped JSON file per release into data/, which the '
+                   'index loads on demand')
 @click.option('-p', '--proxy', required=False, help='HTTP proxy url')
 @click.option('-b', '--bypass-ssl-verify', default=False,
               required=False, show_default=True, is_flag=True,
               help='Bypass SSL verify')
-def run(releases, file_name, proxy, bypass_ssl_verify):
+@click.option('-w', '--workers', default=DEFAULT_WORKERS,
+              type=click.IntRange(min=1), required=False, show_default=True,
+              help='Number of concurrent fetches across all releases')
+@click.option('--per-host-limit', default=DEFAULT_PER_HOST_LIMIT,
+              type=click.IntRange(min=1), required=False, show_default=True,
+              help='Maximum concurrent requests to a single host')
+@click.option('--cache-dir', required=False,
+              type=click.Path(file_okay=False),
+              help='Directory to cache fetched pages, repo indexes and '
+                   'compiled templates, cached entries are revalidated '
+                   'with ETag/Last-Modified')
+@click.option('--max-cache-age', default=DEFAULT_MAX_CACHE_AGE,
+              type=click.IntRange(min=0), required=False, show_default=True,
+              help='Seconds a cached entry is used without revalidation')
+@click.option('--rpm-backend', default=DEFAULT_RPM_BACKEND,
+              type=click.Choice(RPM_BACKENDS), required=False,
+              show_default=True,
+              help='Read openEuler packages from the HTML listing of '
+                   'Packages/ or from repodata/primary metadata')
+@click.option('--state-file', required=False,
+              type=click.Path(dir_okay=False),
+              help='State file of the last run, releases with unchanged '
+                   'inputs reuse stored results and output file is only '
+                   'rewritten when results differ')
+@click.option('--record', required=False, type=click.Path(dir_okay=False),
+              help='Record all fetched responses into a zip archive, '
+                   'responses are added to an existing archive')
+@click.option('--replay', required=False,
+              type=click.Path(exists=True, dir_okay=False),
+              help='Serve all fetches from a zip archive made by --record, '
+                   'without network access')
+@click.option('--report', required=False, type=click.Path(dir_okay=False),
+              help='Write time, bytes and package counts of each stage and '
+                   'each fetched URI to a JSON file')
+@click.option('--openmetrics', required=False,
+              type=click.Path(dir_okay=False),
+              help='Write the run report as OpenMetrics text, e.g. for '
+                   'textfile collector of node_exporter')
+@click.option('--filter', 'filters', multiple=True,
+              help='Regular expression of upstream packages to leave out '
+                   'of comparison, can be given many times')
+@click.option('--filter-file', 'filter_files', multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help='File with one --filter pattern per line, lines starting '
+                   'with "#" are comments')
+@click.option('--arch', 'arches', default=AARCH64, show_default=True,
+              callback=split_arches,
+              help='Comma separated arches of openEuler repos to fetch, '
+                   'any of {}'.format(', '.join(ARCHES)))
+@click.option('--repo-config', default=DEFAULT_REPO_CONFIG,
+              show_default='config/repositories.yaml',
+              type=click.Path(exists=True, dir_okay=False),
+              help='YAML file with URI templates of openEuler repos')
+@click.option('--history-db', required=False,
+              type=click.Path(dir_okay=False),
+              help='SQLite database results of every run are added to, '
+                   'see history command')
+@click.option('--changelog', required=False,
+              type=click.Path(dir_okay=False, allow_dash=True),
+              help='Write package status changes since the last run of '
+                   '--state-file, "-" for stdout')
+@click.option('--changelog-format', default='json', show_default=True,
+              type=click.Choice(CHANGELOG_FILE_TYPES),
+              help='Format of --changelog')
+@click.pass_context
+def run(ctx, releases, file_name, file_format, proxy, bypass_ssl_verify,
+        workers,
+        per_host_limit, cache_dir, max_cache_age, rpm_backend, state_file,
+        record, replay, report, openmetrics, filters, filter_files,
+        arches, repo_config, history_db, changelog, changelog_format):
 
-    if isinstance(proxy, str) and validators.url(proxy):
-        REQUESTS_ARGS.update({'proxies': {'http': proxy, 'https': proxy}})
-    REQUESTS_ARGS.update({'verify': not bypass_ssl_verify})
+    try:
+        setup_upstream_filter(filters, filter_files)
+    except re.error as e:
+        raise click.BadParameter('{}: {}'.format(e.pattern, e),
+                                 param_hint="'--filter'")
+    try:
+        repositories = RepositoryMap.load(repo_config)
+    except (yaml.YAMLError, KeyError, TypeError, ValueError) as e:
+        raise click.BadParameter('{}: {}'.format(repo_config, e),
+                                 param_hint="'--repo-config'")
+    setup_session(proxy, not bypass_ssl_verify, per_host_limit, cache_dir,
+                  max_cache_age)
+    setup_templates(cache_dir)
+    archive = None
+    if replay:
+        setup_replay(replay)
+    elif record:
+        archive = setup_recording(record)
+    METRICS.reset()
+    if ctx.invoked_subcommand is not None:
+        ctx.obj = dict(releases=releases, arches=arches,
+                       repositories=repositories, history_db=history_db,
+                       workers=workers,
+                       cache_dir=cache_dir, rpm_backend=rpm_backend,
+                       archive=archive, report=report,
+                       openmetrics=openmetrics)
+        return
+    if changelog and not state_file:
+        raise click.UsageError('--changelog needs --state-file with results '
+                               'of the last run')
+    try:
+        if file_name is None:
+            file_name = 'index.{}'.format(
+                FILE_EXTENSIONS.get(file_format, file_format))
+        elif file_name == STDOUT_FILE_NAME:
+            if file_format == 'pages':
+                raise click.UsageError(
+                    'pages format writes release data next to the index, '
+                    'it can not be written to stdout')
+            file_name = None
+        check(releases, file_name, file_format, workers, cache_dir,
+              rpm_backend, state_file, arches, repositories, history_db,
+              changelog, changelog_format)
+    finally:
+        if archive is not None:
+            archive.save()
+        if report:
+            METRICS.write_report(report)
+        if openmetrics:
+            METRICS.write_openmetrics(openmetrics)
+
+
+def check(releases, file_name, file_format=DEFAULT_FILE_TYPE,
+          workers=DEFAULT_WORKERS, cache_dir=None,
+          rpm_backend=DEFAULT_RPM_BACKEND, state_file=None,
+          arches=(AARCH64,), repositories=None, history_db=None,
+          changelog=None, changelog_format='json'):
 
     ver_data = {}
-    openstack_ver_uri = openeuler_ver_uri = None
+    releases_config = ReleasesConfig(releases, arches, repositories)
+    ordered_releases = list(dict.fromkeys(releases_config.releases))
+    delta_state = DeltaState(state_file) if state_file else None
+    engine = FetchEngine(releases_config, workers, rpm_backend, cache_dir)
+    renderer = Renderer({},
+                        FORMAT_TEMPLATES.get(file_format, DEFAULT_TEMPLATE),
+                        file_format, file_name)
+    render_seconds = 0.0
+    rendered_releases = 0
+    renderer.open()
     try:
-        releases_config = ReleasesConfig(releases)
-        for release in releases_config.releases:
+        for release, openstack_data, openeuler_data in engine.fetch():
             _release_config = releases_config.releases_config[release]
-            openstack_ver = _release_config['openstack_ver']
-            openstack_ver_uri = _release_config['os_ver_uri'][0]
-            openeuler_ver = _release_config['openeuler_ver']
-            openeuler_ver_uri = _release_config['rpm_os_ver_uri']
-            openstack_data = UpstreamVersions(
-                openstack_ver_uri, openstack_ver).upstream_versions
-            # openEuler vs OpenStack
-            openeuler_data = None
-            if openeuler_ver_uri:
-                openeuler_data = RPMVersions(openeuler_ver_uri,
-                                             openeuler_ver).rpm_versions
-            # else:
-            #     # OpenStack vs OpenStack
-            #     com_openstack_uri = _release_config['os_ver_uri'][-1]
-            #     openeuler_data = UpstreamVersions(
-            #         com_openstack_uri).upstream_versions
-            ver_data[release] = VersionsComparator(
-                openstack_data, openeuler_data).compared_data
-            ver_data[release]['apt'] = _release_config['os_ver_uri'] + \
-                _release_config['rpm_os_ver_uri']
-    except Exception as e:
-        print('openstack_ver_uri: {}\nopeneuler_ver_uri: {}\n'.format(
-            openstack_ver_uri, openeuler_ver_uri))
-        raise e
+            if delta_state is not None:
+                inputs_digest = engine.release_digest(release)
+                ver_data[release] = delta_state.compared_data(
+                    release, inputs_digest)
+            if ver_data.get(release) is not None:
+                delta_state.update(release, inputs_digest,
+                                   ver_data[release], skipped=True)
+            else:
+                ver_data[release] = compare_release(
+                    _release_config, openstack_data, openeuler_data)
+                if delta_state is not None:
+                    delta_state.diff(release, ver_data[release])
+                    delta_state.update(release, inputs_digest,
+                                       ver_data[release], skipped=False)
+            # releases are compared in order of arrival, pass them to
+            # renderer in the order they are given
+            start = time.perf_counter()
+            while rendered_releases < len(ordered_releases) and \
+                    ordered_releases[rendered_releases] in ver_data:
+                renderer.add(ordered_releases[rendered_releases],
+                             ver_data[ordered_releases[rendered_releases]])
+                rendered_releases += 1
+            render_seconds += time.perf_counter() - start
+    except Exception:
+        renderer.close(commit=False)
+        raise
+    ver_data = {release: ver_data[release] for release in ordered_releases}
+
+    rendered = True
+    if delta_state is not None:
+        rendered = delta_state.output_changed(ordered_releases) or \
+            file_name is None or not os.path.exists(file_name)
+    start = time.perf_counter()
+    renderer.close(commit=rendered)
+    if rendered:
+        METRICS.add_stage('render',
+                          render_seconds + time.perf_counter() - start,
+                          packages=sum(len(_ver_data['data'])
+                                       for _ver_data in ver_data.values()))
+    if history_db:
+        History(history_db).append(ver_data)
+    if delta_state is not None:
+        delta_state.save()
+        if changelog:
+            delta_state.write_changelog(changelog, changelog_format)
+        click.echo('Skipped releases: {}\nRecomputed releases: {}\n'
+                   'Changed releases: {}\nOutput {}'.format(
+                       ', '.join(delta_state.skipped) or '-',
+                       ', '.join(delta_state.recomputed) or '-',
+                       ', '.join(delta_state.changed) or '-',
+                       'rewritten' if rendered else 'unchanged'), err=True)
+
+
+@run.command(help='Keep checking releases in the background and serve the '
+                  'latest results over HTTP: /, /api/releases, '
+                  '/api/releases/<release> and /metrics')
+@click.option('--listen', default=DEFAULT_LISTEN, show_default=True,
+              help='Address to listen on')
+@click.option('--port', default=DEFAULT_PORT, show_default=True,
+              type=click.IntRange(min=0, max=65535), help='Port to listen on')
+@click.option('--interval', default=DEFAULT_REFRESH_INTERVAL,
+              show_default=True, type=click.IntRange(min=1),
+              help='Seconds between refreshes of each release')
+@click.option('--jitter', default=DEFAULT_REFRESH_JITTER, show_default=True,
+              type=click.IntRange(min=0),
+              help='Random seconds added to each refresh interval')
+@click.pass_obj
+def serve(obj, listen, port, interval, jitter):
+    releases_config = ReleasesConfig(obj['releases'], obj['arches'],
+                                     obj['repositories'])
+    store = ResultStore(releases_config.releases)
+
+    def on_refresh():
+        if obj['report']:
+            METRICS.write_report(obj['report'])
+        if obj['openmetrics']:
+            METRICS.write_openmetrics(obj['openmetrics'])
+
+    scheduler = Scheduler(
+        releases_config, store,
+        FetchEngine(releases_config, obj['workers'], obj['rpm_backend'],
+                    obj['cache_dir']),
+        interval, jitter, on_refresh,
+        History(obj['history_db']) if obj['history_db'] else None)
+    server = http.server.ThreadingHTTPServer(
+        (listen, port), functools.partial(ResultHandler, store))
+    scheduler.start()
+    click.echo('Serving on http://{}:{}/'.format(*server.server_address[:2]),
+               err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+        server.server_close()
+        if obj['archive'] is not None:
+            obj['archive'].save()
+
 
-    Renderer(ver_data, "template_os_checker.j2", DEFAULT_FILE_TYPE, file_name
-             ).render()
+@run.command(help='Query results added to --history-db: when packages '
+                  'changed status, or status counts of releases over time')
+@click.option('--package', required=False,
+              help='Show runs where status of the package changed')
+@click.option('--release', required=False, help='Only show this release')
+@click.option('--status', required=False,
+              type=click.Choice([status[1] for status in STATUSES]),
+              help='With --package, only show runs where the package '
+                   'became this status')
+@click.pass_obj
+def history(obj, package, release, status):
+    if not obj['history_db'] or not os.path.exists(obj['history_db']):
+        raise click.UsageError('history needs an existing --history-db')
+    _history = History(obj['history_db'])
+    if package:
+        click.echo("{:<30} {:<27} {:<10} {:<10}".format(
+            'Release', 'Run time', 'From', 'To'))
+        for _release, run_time, previous, _status in \
+                _history.transitions(package, release, status):
+            click.echo("{:<30} {:<27} {:<10} {:<10}".format(
+                _release, run_time, previous or '-', _status))
+        return
+    click.echo(' '.join(["{:<30} {:<27}".format('Release', 'Run time')] +
+                        ["{:<9}".format(_status[1]) for _status in STATUSES]))
+    for _release, run_time, counts in _history.status_counts(release):
+        click.echo(' '.join(["{:<30} {:<27}".format(_release, run_time)] +
+                            ["{:<9}".format(counts.get(_status[1], 0))
+                             for _status in STATUSES]))
 
 
 if __name__ == '__main__':
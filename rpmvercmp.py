@@ -0,0 +1,66 @@
+"""Version comparison compatible with rpmvercmp() of rpm.
+
+Versions are turned into keys, which sort in the same order as
+rpmvercmp() compares the versions, so the key of each version is built
+once and many versions are compared or sorted by their keys.
+"""
+import functools
+import re
+
+KEY_CACHE_SIZE = 65536
+# rpmvercmp() only knows ASCII letters and digits, any other character
+# except "~" and "^" separates segments
+SEGMENT = re.compile(r"(~)|(\^)|([0-9]+)|([a-zA-Z]+)")
+# rank of segments: "~" sorts before the end of version, "^" after the
+# end of version but before any other segment, numeric segments are newer
+# than alphabetic ones
+TILDE, END, CARET, ALPHA, NUMERIC = range(5)
+EVR = re.compile(r"^(?:(\d+):)?([^-]*)(?:-(.*))?$")
+
+
+@functools.lru_cache(maxsize=KEY_CACHE_SIZE)
+def version_key(ver):
+    key = []
+    for tilde, caret, numeric, alpha in SEGMENT.findall(ver or ''):
+        if tilde:
+            key.append((TILDE,))
+        elif caret:
+            key.append((CARET,))
+        elif numeric:
+            key.append((NUMERIC, int(numeric)))
+        else:
+            key.append((ALPHA, alpha))
+    key.append((END,))
+    return tuple(key)
+
+
+def evr_key(epoch=None, ver=None, release=None):
+    # missing epoch is 0, missing release sorts before any release
+    return int(epoch or 0), version_key(ver), version_key(release)
+
+
+def parse_evr(evr):
+    # "[epoch:]version[-release]" to (epoch, version, release)
+    epoch, ver, release = EVR.match(evr).groups()
+    return epoch, ver, release
+
+
+def rpmvercmp(a, b):
+    # 1 if a is newer, -1 if b is newer, 0 if they are equal
+    a_key, b_key = version_key(a), version_key(b)
+    return (a_key > b_key) - (a_key < b_key)
+
+
+def evrcmp(a, b):
+    # like rpmvercmp(), for "[epoch:]version[-release]" strings
+    a_key, b_key = evr_key(*parse_evr(a)), evr_key(*parse_evr(b))
+    return (a_key > b_key) - (a_key < b_key)
+
+
+def compare(a_versions, b_versions, key=version_key):
+    # rpmvercmp() of each pair of versions, the key of every distinct
+    # version is built once, key may be a cached variant of version_key()
+    a_keys = [key(ver) for ver in a_versions]
+    b_keys = [key(ver) for ver in b_versions]
+    return [(a_key > b_key) - (a_key < b_key)
+            for a_key, b_key in zip(a_keys, b_keys)]
@@ -0,0 +1,47 @@
+import unittest
+
+from VersionStatus import LinkScanner, RPM_LINK_PATTERN
+
+PAGE = ('<html>\n'
+        '<a href="openstack-nova-20.6.1-1.oe2203sp4.noarch.rpm">x</a>\n'
+        '<a\nhref="openstack-neutron-15.3.3-1.oe2203sp4.noarch.rpm"\n'
+        '>x</a>\n'
+        '<a href="python3-novaclient-15.1.0-1.oe2203sp4.noarch.rpm">x</a>\n'
+        '</html>\n')
+
+
+def scan(chunks):
+    scanner = LinkScanner()
+    links = []
+    for chunk in chunks:
+        links.extend(scanner.feed(chunk))
+    links.extend(scanner.feed(b'', final=True))
+    return links
+
+
+class LinkScannerTest(unittest.TestCase):
+    def test_whole_page(self):
+        self.assertEqual(scan([PAGE.encode()]),
+                         RPM_LINK_PATTERN.findall(PAGE))
+        self.assertEqual(len(scan([PAGE.encode()])), 3)
+
+    def test_chunk_split_inside_multi_line_anchor(self):
+        body = PAGE.encode()
+        split = body.index(b'<a\nhref') + len(b'<a\n')
+        self.assertEqual(scan([body[:split], body[split:]]),
+                         RPM_LINK_PATTERN.findall(PAGE))
+
+    def test_every_split(self):
+        body = PAGE.encode()
+        for split in range(len(body) + 1):
+            self.assertEqual(scan([body[:split], body[split:]]),
+                             RPM_LINK_PATTERN.findall(PAGE), split)
+
+    def test_byte_by_byte(self):
+        body = PAGE.encode()
+        self.assertEqual(scan([body[i:i + 1] for i in range(len(body))]),
+                         RPM_LINK_PATTERN.findall(PAGE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import random
+import unittest
+
+from VersionStatus import OPENEULER_DEFAULT_REPLACE, PairingIndex
+
+
+def get_pair(base_pkg_name, from_data):
+    # pairing of VersionsComparator before PairingIndex, paired names were
+    # removed from from_data
+    default_replace = OPENEULER_DEFAULT_REPLACE.sub("-", base_pkg_name)
+    cases = [
+        base_pkg_name,
+        default_replace,
+        default_replace.replace("python-", "python2-"),
+        default_replace.replace("python-", "python3-"),
+        "python2-{}".format(default_replace),
+        "python3-{}".format(default_replace),
+        "openstack-{}".format(default_replace),
+    ]
+    for case in cases:
+        if case in from_data:
+            return case
+    return None
+
+
+BASE_PKG_NAMES = [
+    'nova', 'python-novaclient', 'oslo.config', 'python-python2-nova',
+    'python_nova', 'os-brick', 'python-python-nova', 'python-nova',
+]
+COMP_PKG_NAMES = [
+    'nova', 'openstack-nova', 'python3-novaclient', 'python2-novaclient',
+    'python3-oslo-config', 'oslo-config', 'python2-python2-nova',
+    'python3-python2-nova', 'python-python-nova', 'python2-python-nova',
+    'python3-python-nova', 'python3-nova', 'python2-nova', 'os-brick',
+    'python3-os-brick', 'python-nova', 'python_nova',
+]
+
+
+class PairingIndexTest(unittest.TestCase):
+    def pair_all(self, base_pkg_names, comp_pkg_names):
+        index = PairingIndex(comp_pkg_names)
+        claimed = set()
+        pairs = []
+        for base_pkg_name in base_pkg_names:
+            comp_pkg_name = index.get(base_pkg_name, claimed)
+            if comp_pkg_name is not None:
+                claimed.add(comp_pkg_name)
+            pairs.append(comp_pkg_name)
+        return pairs
+
+    def get_pair_all(self, base_pkg_names, comp_pkg_names):
+        remaining = set(comp_pkg_names)
+        pairs = []
+        for base_pkg_name in base_pkg_names:
+            comp_pkg_name = get_pair(base_pkg_name, remaining)
+            remaining.discard(comp_pkg_name)
+            pairs.append(comp_pkg_name)
+        return pairs
+
+    def test_python_to2_rule(self):
+        self.assertEqual(
+            self.pair_all(['python-python2-nova'],
+                          ['python2-python2-nova', 'python3-python2-nova']),
+            ['python2-python2-nova'])
+
+    def test_claimed_names(self):
+        self.assertEqual(
+            self.pair_all(['python-nova', 'python_nova', 'python.nova'],
+                          ['python-nova', 'python2-nova']),
+            ['python-nova', 'python2-nova', None])
+
+    def test_same_as_get_pair(self):
+        # random orders of upstream names against random subsets of
+        # openEuler names
+        rand = random.Random(0)
+        for _ in range(2000):
+            comp_pkg_names = rand.sample(
+                COMP_PKG_NAMES, rand.randint(0, len(COMP_PKG_NAMES)))
+            base_pkg_names = rand.sample(BASE_PKG_NAMES, len(BASE_PKG_NAMES))
+            self.assertEqual(
+                self.pair_all(base_pkg_names, comp_pkg_names),
+                self.get_pair_all(base_pkg_names, comp_pkg_names),
+                (base_pkg_names, comp_pkg_names))
+
+
+if __name__ == '__main__':
+    unittest.main()
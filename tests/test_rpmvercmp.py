@@ -0,0 +1,42 @@
+import unittest
+
+import rpmvercmp
+
+
+class RpmvercmpTest(unittest.TestCase):
+    def test_rpmvercmp(self):
+        # cases from the rpmvercmp() tests of rpm
+        for a, b, expected in [
+                ('1.0', '1.0', 0),
+                ('1.0', '2.0', -1),
+                ('2.0.1', '2.0', 1),
+                ('2.0', '2.0.0', -1),
+                ('5.5p1', '5.5p10', -1),
+                ('10xyz', '10.1xyz', -1),
+                ('xyz10', 'xyz10.1', -1),
+                ('1.0a', '1.0', 1),
+                ('1.0', '1.0a', -1),
+                ('1.0~rc1', '1.0', -1),
+                ('1.0~rc1', '1.0~rc2', -1),
+                ('1.0~rc1~git123', '1.0~rc1', -1),
+                ('1.0^', '1.0', 1),
+                ('1.0^git1', '1.0.1', -1),
+                ('1.0^git1', '1.0~rc1', 1),
+                ('a', '1', -1),
+                ('1_0', '1.0', 0)]:
+            self.assertEqual(rpmvercmp.rpmvercmp(a, b), expected, (a, b))
+            self.assertEqual(rpmvercmp.rpmvercmp(b, a), -expected, (b, a))
+
+    def test_evrcmp(self):
+        self.assertEqual(rpmvercmp.evrcmp('1:1.0-1', '2.0-1'), 1)
+        self.assertEqual(rpmvercmp.evrcmp('1.0-2', '1.0-10'), -1)
+        self.assertEqual(rpmvercmp.evrcmp('0:1.0', '1.0-1'), -1)
+
+    def test_compare(self):
+        self.assertEqual(rpmvercmp.compare(['1.0', '2.0', '3.0'],
+                                           ['1.0', '1.0', '3.1']),
+                         [0, 1, -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from VersionStatus import (STATUS_EOL, STATUS_MISMATCH, STATUS_OK,
+                           STATUS_OUTDATED, version_statuses)
+
+
+class VersionStatusesTest(unittest.TestCase):
+    def assertStatus(self, base_ver, comp_ver, status):
+        self.assertEqual(version_statuses([base_ver], [comp_ver]), [status],
+                         (base_ver, comp_ver))
+
+    def test_trailing_zero_components(self):
+        # rpm sorts 2.0 before 2.0.0, upstream versions do not
+        self.assertStatus('2.0', '2.0.0', STATUS_OK)
+        self.assertStatus('2.0.0', '2.0', STATUS_OK)
+        self.assertStatus('0.7.0', '0.7', STATUS_OK)
+        self.assertStatus('13.0.0.0rc1', '13.0~rc1', STATUS_OK)
+        self.assertStatus('2.0.1', '2.0', STATUS_OUTDATED)
+        self.assertStatus('2.0', '2.0.1', STATUS_MISMATCH)
+
+    def test_pre_releases(self):
+        self.assertStatus('13.0.0.0rc1', '13.0.0~rc1', STATUS_OK)
+        self.assertStatus('13.0.0', '13.0.0~rc1', STATUS_OUTDATED)
+        self.assertStatus('13.0.0.0rc1', '13.0.0', STATUS_MISMATCH)
+        self.assertStatus('2.0.0b2', '2.0.0~b2', STATUS_OK)
+
+    def test_versions(self):
+        self.assertStatus('20.6.1', '20.6.1', STATUS_OK)
+        self.assertStatus('1.10.0', '1.9.0', STATUS_OUTDATED)
+        self.assertStatus('15.3.3', '15.3.4', STATUS_MISMATCH)
+        self.assertStatus('6.11.3', '6.11.3+git1', STATUS_OK)
+        self.assertStatus('eom', '1.0', STATUS_EOL)
+
+
+if __name__ == '__main__':
+    unittest.main()
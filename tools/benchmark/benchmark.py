@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Benchmark parse, compare and render stages of VersionStatus.
+
+Synthetic upstream pages, RPM listings and repodata are served through the
+replay adapter of VersionStatus, so the real fetch and parse code runs
+without network access.
+"""
+
+import gc
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..'))
+import VersionStatus  # noqa: E402
+
+OS_URI = 'https://releases.openstack.org/bench'
+RPM_URI = 'https://repo.openeuler.org/openEuler-bench/EPOL/aarch64/Packages/'
+REPOMD = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+          '<repomd xmlns="http://linux.duke.edu/metadata/repo">\n'
+          '<data type="primary">'
+          '<checksum type="sha256">{checksum}</checksum>'
+          '<location href="repodata/{checksum}-primary.xml.gz"/>'
+          '</data>\n</repomd>\n')
+RPM_PREFIXES = ('python3-', 'openstack-', '')
+DEFAULT_THRESHOLD = 0.2
+# stages whose results a stage needs, they are run before it when its peak
+# RSS is measured in a process of its own
+STAGE_DEPENDS = {
+    'compare': ('parse_upstream', 'parse_rpm'),
+    'render_html': ('parse_upstream', 'parse_rpm', 'compare'),
+    'render_txt': ('parse_upstream', 'parse_rpm', 'compare'),
+}
+
+
+def upstream_page(tarballs):
+    # M tarballs, 4 versions of each upstream package
+    lines = ['<html><body><table>']
+    for i in range(tarballs):
+        pkg_name = 'pkg{}.lib'.format(i // 4)
+        lines.append('<tr><td><a href="https://tarballs.opendev.org/{0}/'
+                     '{0}-{1}.{2}.0.tar.gz">{0}</a></td></tr>'.format(
+                         pkg_name, i // 4 % 30, i % 4))
+    lines.append('</table></body></html>')
+    return '\n'.join(lines).encode()
+
+
+def rpm_packages(rpms):
+    # N rpms, 2 versions of each openEuler package
+    for i in range(rpms):
+        pkg_name = '{}pkg{}-lib'.format(RPM_PREFIXES[i // 2 % 3], i // 2)
+        yield pkg_name, '{}.{}.0'.format(i // 2 % 30, i % 2 + 1), \
+            '{}.oe2203sp4'.format(i % 3 + 1)
+
+
+def rpm_listing(rpms):
+    lines = ['<html><body><pre>']
+    for pkg_name, ver, rel in rpm_packages(rpms):
+        lines.append('<a href="{0}-{1}-{2}.noarch.rpm">{0}-{1}-{2}.noarch.rpm'
+                     '</a>  01-Jan-2024 00:00  123456'.format(
+                         pkg_name, ver, rel))
+    lines.append('</pre></body></html>')
+    return '\n'.join(lines).encode()
+
+
+def primary_xml(rpms):
+    packages = []
+    for pkg_name, ver, rel in rpm_packages(rpms):
+        packages.append(
+            '<package type="rpm"><name>{0}</name><arch>noarch</arch>'
+            '<version epoch="0" ver="{1}" rel="{2}"/>'
+            '<summary>{0}</summary><location href="Packages/{0}-{1}-{2}'
+            '.noarch.rpm"/><format><rpm:license>ASL 2.0</rpm:license>'
+            '<rpm:requires><rpm:entry name="python3"/></rpm:requires>'
+            '</format></package>'.format(pkg_name, ver, rel))
+    return gzip.compress(
+        ('<?xml version="1.0" encoding="UTF-8"?>\n'
+         '<metadata xmlns="http://linux.duke.edu/metadata/common" '
+         'xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="{}">\n'
+         .format(rpms) + '\n'.join(packages) + '\n</metadata>\n').encode(),
+        mtime=0)
+
+
+def setup_replay(rpms, tarballs):
+    archive = VersionStatus.ReplayArchive(None)
+    archive.add(OS_URI, 200, {}, upstream_page(tarballs))
+    archive.add(RPM_URI, 200, {}, rpm_listing(rpms))
+    repo_uri = RPM_URI[:-len('Packages/')]
+    checksum = 'bench{}'.format(rpms)
+    archive.add(repo_uri + 'repodata/repomd.xml', 200, {},
+                REPOMD.format(checksum=checksum).encode())
+    archive.add('{}repodata/{}-primary.xml.gz'.format(repo_uri, checksum),
+                200, {}, primary_xml(rpms))
+    adapter = VersionStatus.ReplayAdapter(archive)
+    VersionStatus.SESSION.mount('http://', adapter)
+    VersionStatus.SESSION.mount('https://', adapter)
+
+
+def measure(fn, repeat):
+    # time of each repeat, then one more run under tracemalloc, which
+    # slows down the code, for peak memory allocated by the stage
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dict(best=min(times), median=sorted(times)[len(times) // 2],
+                peak_alloc=peak)
+
+
+def peak_rss():
+    # VmHWM is the peak RSS of this process image in KiB, ru_maxrss of a
+    # process started by the benchmark may keep the peak of the benchmark
+    # itself on Linux, which it had when forking the process
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def max_rss(name, rpms, tarballs, releases):
+    # ru_maxrss is the peak of the whole process so far, so each stage is
+    # run once more in a fresh process, with only the stages it depends on
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--rpms', str(rpms),
+         '--tarballs', str(tarballs), '--releases', str(releases),
+         '--rss-stage', name], check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)['max_rss']
+
+
+def stages(releases, output_dir):
+    state = {}
+
+    def parse_upstream():
+        state['upstream'] = VersionStatus.UpstreamVersions(
+            OS_URI, 'bench').upstream_versions
+
+    def parse_rpm():
+        state['rpm'] = VersionStatus.RPMVersions(
+            [RPM_URI], 'bench').rpm_versions
+
+    def parse_repodata():
+        # forget parsed repodata, otherwise the checksum skips the parsing
+        VersionStatus.RepodataVersions._parsed.clear()
+        VersionStatus.RPMVersions([RPM_URI], 'bench', 'repodata').rpm_versions
+
+    def compare():
+        state['ver_data'] = {}
+        for i in range(releases):
+            release = 'bench-{}/bench'.format(i)
+            state['ver_data'][release] = VersionStatus.VersionsComparator(
+                state['upstream'], state['rpm']).compared_data
+            state['ver_data'][release]['apt'] = [OS_URI, RPM_URI]
+
+    def render_html():
+        VersionStatus.Renderer(state['ver_data'], 'template_os_checker.j2',
+                               'html', os.path.join(output_dir, 'index.html')
+                               ).render()
+
+    def render_txt():
+        VersionStatus.Renderer(state['ver_data'], 'template_os_checker.j2',
+                               'txt', os.path.join(output_dir, 'index.txt')
+                               ).render()
+
+    return [('parse_upstream', parse_upstream),
+            ('parse_rpm', parse_rpm),
+            ('parse_repodata', parse_repodata),
+            ('compare', compare),
+            ('render_html', render_html),
+            ('render_txt', render_txt)]
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('--rpms', default=5000, type=click.IntRange(min=1),
+              show_default=True, help='RPMs in the openEuler listing')
+@click.option('--tarballs', default=2000, type=click.IntRange(min=1),
+              show_default=True, help='Tarballs in the upstream page')
+@click.option('--releases', default=20, type=click.IntRange(min=1),
+              show_default=True, help='Releases to compare and render')
+@click.option('--repeat', default=3, type=click.IntRange(min=1),
+              show_default=True, help='Timed runs of each stage')
+@click.option('--save-baseline', type=click.Path(dir_okay=False),
+              help='Save results as baseline JSON file')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Compare results against a baseline JSON file')
+@click.option('--threshold', default=DEFAULT_THRESHOLD, show_default=True,
+              type=click.FloatRange(min=0),
+              help='Relative slowdown against baseline reported as failure')
+@click.option('--rss-stage', hidden=True,
+              help='Run only this stage and print peak RSS of the process')
+def main(rpms, tarballs, releases, repeat, save_baseline, baseline,
+         threshold, rss_stage):
+    setup_replay(rpms, tarballs)
+    if rss_stage:
+        with tempfile.TemporaryDirectory() as output_dir:
+            fns = dict(stages(releases, output_dir))
+            for name in STAGE_DEPENDS.get(rss_stage, ()) + (rss_stage, ):
+                fns[name]()
+        click.echo(json.dumps(dict(max_rss=peak_rss())))
+        return
+    results = dict(params=dict(rpms=rpms, tarballs=tarballs,
+                               releases=releases, repeat=repeat),
+                   stages={})
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, fn in stages(releases, output_dir):
+            results['stages'][name] = measure(fn, repeat)
+    for name, stage in results['stages'].items():
+        stage['max_rss'] = max_rss(name, rpms, tarballs, releases)
+
+    baseline_stages = {}
+    if baseline:
+        with open(baseline) as f:
+            baseline_results = json.load(f)
+        baseline_stages = baseline_results['stages']
+        if baseline_results['params'] != results['params']:
+            click.echo('Warning: baseline is made with {}'.format(
+                baseline_results['params']), err=True)
+    slower = []
+    click.echo('{:<16} {:>12} {:>12} {:>14} {:>12} {:>10}'.format(
+        'Stage', 'Best (ms)', 'Median (ms)', 'Peak alloc KiB', 'Max RSS KiB',
+        'Baseline'))
+    for name, stage in results['stages'].items():
+        change = ''
+        if name in baseline_stages:
+            ratio = stage['best'] / baseline_stages[name]['best'] - 1
+            change = '{:+.1%}'.format(ratio)
+            if ratio > threshold:
+                slower.append(name)
+        click.echo('{:<16} {:>12.2f} {:>12.2f} {:>14} {:>12} {:>10}'.format(
+            name, stage['best'] * 1000, stage['median'] * 1000,
+            stage['peak_alloc'] // 1024, stage['max_rss'], change))
+
+    if save_baseline:
+        with open(save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+    if slower:
+        raise click.ClickException('Slower than baseline: {}'.format(
+            ', '.join(slower)))
+
+
+if __name__ == '__main__':
+    main()